@@ -2,8 +2,18 @@
 import streamlit as st
 import requests
 import json
+import gzip
+import brotli
+import threading
+import time
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlencode
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
 from streamlit_browser_storage import LocalStorage
 from requests.exceptions import RequestException
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
 from datetime import date, datetime
 
 # === CONFIGURACIÓN ===
@@ -12,10 +22,67 @@ LOGIN_URL = DJANGO_API_BASE + "auth/jwt/create/"
 REFRESH_URL = DJANGO_API_BASE + "auth/jwt/refresh/"
 REGISTER_URL = DJANGO_API_BASE + "register/users/"
 
+# Pool de conexiones HTTP (compartido por todas las sesiones del proceso)
+HTTP_POOL_CONNECTIONS = 4   # hosts distintos que se mantienen en el pool
+HTTP_POOL_MAXSIZE = 16      # conexiones keep-alive por host
+
+# Carga masiva por lotes
+UPLOAD_CHUNK_SIZE = 2000          # registros por lote
+UPLOAD_MAX_WORKERS = 4            # lotes enviados en paralelo
+UPLOAD_MAX_RETRIES = 3            # reintentos por lote ante fallos transitorios
+UPLOAD_BACKOFF_SECONDS = 1.0      # espera base (se duplica en cada reintento)
+# Sin 504: el gateway puede cortar por tiempo cuando el backend ya guardó el
+# lote, y reenviarlo duplicaría filas
+UPLOAD_RETRY_STATUS = (502, 503)
+# (conexión, lectura) en segundos. Si no conecta a tiempo el lote se reintenta;
+# si la respuesta tarda más que la lectura, el lote queda como fallido sin reenviar
+UPLOAD_TIMEOUT = (10, 120)
+
+# Compresión y formato del cuerpo (opt-in: el backend debe aceptar Content-Encoding
+# y el formato por columnas antes de activarlos)
+UPLOAD_COMPRESSION = None             # None, "gzip" o "br"
+UPLOAD_COMPRESSION_MIN_BYTES = 32 * 1024   # cuerpos menores se envían sin comprimir
+UPLOAD_COLUMNAR = False               # True: {columna: [valores]} en lugar de registros
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+# Lectura paginada de listados
+PAGE_SIZE = 1000                  # registros pedidos por página
+
 # === ALMACENAMIENTO PERSISTENTE ===
 storage = LocalStorage(key="auth_tokens")
 
 
+# ===============================================================
+# 🔹 SESIÓN HTTP COMPARTIDA (keep-alive)
+# ===============================================================
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    Devuelve la requests.Session del proceso, creándola la primera vez.
+    Reutiliza las conexiones TCP+TLS con el backend entre peticiones y usuarios.
+    No guarda cookies: la autenticación va en el encabezado Bearer de cada
+    petición y así nada de un usuario queda en la sesión compartida.
+    """
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_POOL_CONNECTIONS,
+                    pool_maxsize=HTTP_POOL_MAXSIZE,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                _http_session = session
+    return _http_session
+
+
 # ===============================================================
 # 🔹 INICIALIZACIÓN DEL ESTADO DE SESIÓN
 # ===============================================================
@@ -52,7 +119,7 @@ def init_session_state():
 # ===============================================================
 def login_user(username, password):
     try:
-        response = requests.post(LOGIN_URL, json={"username": username, "password": password})
+        response = get_http_session().post(LOGIN_URL, json={"username": username, "password": password})
         
         if response.status_code == 200:
             tokens = response.json()
@@ -104,7 +171,7 @@ def refresh_access_token(silent=False):
         return False
 
     try:
-        response = requests.post(
+        response = get_http_session().post(
             REFRESH_URL,
             json={"refresh": refresh_token},
             headers={"Content-Type": "application/json"},
@@ -151,23 +218,23 @@ def get_auth_headers():
 # ===============================================================
 # 🔹 PETICIONES PROTEGIDAS (con auto-refresh)
 # ===============================================================
-def protected_request_with_retry(method, url, data=None, json=None):
+def protected_request_with_retry(method, url, data=None, json=None, extra_headers=None):
     """Realiza una petición autenticada y refresca el token si expira."""
-    headers = get_auth_headers()
+    headers = {**get_auth_headers(), **(extra_headers or {})}
     kwargs = {"headers": headers}
     if data is not None:
         kwargs["data"] = data
     if json is not None:
         kwargs["json"] = json
 
-    response = requests.request(method, url, **kwargs)
+    response = get_http_session().request(method, url, **kwargs)
 
     if response.status_code == 401:
         st.warning("⏳ Token expirado. Intentando renovar...")
         if refresh_access_token(silent=True):
-            headers = get_auth_headers()
+            headers = {**get_auth_headers(), **(extra_headers or {})}
             kwargs["headers"] = headers
-            response = requests.request(method, url, **kwargs)
+            response = get_http_session().request(method, url, **kwargs)
         else:
             logout_user()
 
@@ -177,23 +244,139 @@ def protected_request_with_retry(method, url, data=None, json=None):
 def protected_get(url):
     return protected_request_with_retry("GET", url)
 
-def protected_post(url, data):
-    """Envía una solicitud POST autenticada, asegurando que las fechas sean serializables."""
-    
-    # ✅ Conversor seguro para fechas y valores no serializables
-    def default_converter(o):
-        if isinstance(o, (datetime, date)):
-            return o.isoformat()
-        if pd.isna(o):
-            return None
-        return str(o)
+
+def protected_get_paginado(url, params=None, tamano_pagina=PAGE_SIZE, max_filas=None, estado=None):
+    """
+    Recorre un listado paginado y entrega cada página como un DataFrame, para que
+    la página pueda mostrar datos antes de terminar la descarga.
+
+    Pide `limit`/`offset` y sigue el enlace `next` de la respuesta (formato de
+    paginación de DRF: {"results": [...], "next": url}), así que también funciona
+    con paginación por cursor. Se detiene al llegar a `max_filas`.
+    Si el endpoint ignora la paginación y devuelve una lista, se entrega completa
+    como una sola página: `max_filas` no se aplica porque el orden pedido
+    tampoco está garantizado.
+    Si se pasa `estado` (dict), se completa con "paginado" (la respuesta venía
+    paginada) y "truncado" (quedaron filas sin descargar por `max_filas`).
+    Lanza requests.HTTPError (con la respuesta) si una página no responde 200.
+    """
+    params = {"limit": tamano_pagina, "offset": 0, **(params or {})}
+    separador = "&" if "?" in url else "?"
+    siguiente = f"{url}{separador}{urlencode(params)}"
+    filas = 0
+    if estado is None:
+        estado = {}
+    estado.update(paginado=False, truncado=False)
+
+    while siguiente:
+        response = protected_request_with_retry("GET", siguiente)
+        if response.status_code != 200:
+            raise requests.exceptions.HTTPError(f"Error API: Código {response.status_code}", response=response)
+
+        datos = response.json()
+        if not (isinstance(datos, dict) and "results" in datos):
+            # Lista sin paginar: se entrega tal cual, sin recortar
+            if datos:
+                yield pd.DataFrame(datos)
+            return
+
+        estado["paginado"] = True
+        registros, siguiente = datos["results"], datos.get("next")
+        if max_filas is not None and filas + len(registros) > max_filas:
+            registros = registros[:max_filas - filas]
+            estado["truncado"] = True
+        if registros:
+            filas += len(registros)
+            yield pd.DataFrame(registros)
+        if max_filas is not None and filas >= max_filas:
+            estado["truncado"] = estado["truncado"] or bool(siguiente)
+            return
+
+# ✅ Conversor seguro para fechas y valores no serializables
+def default_converter(o):
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    if pd.isna(o):
+        return None
+    return str(o)
+
+
+def _fechas_objeto_a_iso(df):
+    """
+    Convierte a texto ISO las columnas 'object' que contienen date/datetime de Python
+    (las columnas datetime64 las resuelve to_json). Solo copia si hay algo que cambiar.
+    """
+    columnas = [
+        col for col in df.columns[df.dtypes == object]
+        if pd.api.types.infer_dtype(df[col], skipna=True) in ("date", "datetime")
+    ]
+    if not columnas:
+        return df
+    df = df.copy()
+    for col in columnas:
+        df[col] = df[col].map(lambda v: v.isoformat() if isinstance(v, (datetime, date)) else v)
+    return df
+
+
+_OPCIONES_TO_JSON = dict(date_format="iso", date_unit="s", double_precision=15, force_ascii=False)
+
+
+def serializar_json(data, columnar=False):
+    """
+    Serializa el cuerpo de una petición a bytes JSON (UTF-8).
+    Si `data` es un DataFrame se usa to_json (registros, fechas ISO, NaN -> null)
+    sin pasar por una lista de diccionarios; cualquier otro objeto usa json.dumps.
+    Con `columnar=True` una tabla se envía como {columna: [valores]}, sin repetir
+    los nombres de columna en cada registro.
+    """
+    if columnar and isinstance(data, list):
+        data = pd.DataFrame(data)
+    if isinstance(data, pd.DataFrame):
+        df = _fechas_objeto_a_iso(data)
+        if not columnar:
+            return df.to_json(orient="records", **_OPCIONES_TO_JSON).encode("utf-8")
+        partes = [
+            json.dumps(str(col), ensure_ascii=False) + ":" + df[col].to_json(orient="records", **_OPCIONES_TO_JSON)
+            for col in df.columns
+        ]
+        return ("{" + ",".join(partes) + "}").encode("utf-8")
+    return json.dumps(data, default=default_converter).encode("utf-8")
+
+
+def preparar_cuerpo(data, compresion=None, columnar=False):
+    """
+    Serializa y, si corresponde, comprime el cuerpo. Devuelve (bytes, encabezados extra).
+    Solo se comprime cuando el cuerpo supera UPLOAD_COMPRESSION_MIN_BYTES.
+    """
+    cuerpo = serializar_json(data, columnar=columnar)
+    encabezados = {}
+    if columnar and isinstance(data, (list, pd.DataFrame)):
+        encabezados["X-Payload-Format"] = "columnar"
+
+    if compresion and len(cuerpo) >= UPLOAD_COMPRESSION_MIN_BYTES:
+        if compresion == "gzip":
+            cuerpo = gzip.compress(cuerpo, compresslevel=GZIP_LEVEL)
+        elif compresion == "br":
+            cuerpo = brotli.compress(cuerpo, quality=BROTLI_QUALITY)
+        else:
+            raise ValueError(f"Compresión no soportada: {compresion}")
+        encabezados["Content-Encoding"] = compresion
+    return cuerpo, encabezados
+
+
+def protected_post(url, data, compresion=None, columnar=False):
+    """
+    Envía una solicitud POST autenticada, asegurando que las fechas sean serializables.
+    `data` puede ser un objeto JSON (dict/lista) o directamente un DataFrame.
+    `compresion` ("gzip" o "br") y `columnar` son opcionales; ver preparar_cuerpo.
+    """
 
     try:
         # Serialización robusta
-        json_data = json.dumps(data, default=default_converter)
+        json_data, encabezados = preparar_cuerpo(data, compresion=compresion, columnar=columnar)
 
         # Enviar la solicitud usando tu función con autenticación y reintentos
-        response = protected_request_with_retry("POST", url, data=json_data)
+        response = protected_request_with_retry("POST", url, data=json_data, extra_headers=encabezados)
         return response
 
     except TypeError as e:
@@ -210,6 +393,186 @@ def protected_patch(url, data):
     return protected_request_with_retry("PATCH", url, json=data)
 
 
+# ===============================================================
+# 🔹 CARGA MASIVA POR LOTES (paralela, con reintentos)
+# ===============================================================
+def _sin_enviar(error):
+    """True si la conexión falló antes de enviar la petición (reintentar no duplica)."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    causa = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(causa, (NewConnectionError, ConnectTimeoutError))
+
+
+def _post_lote(url, lote, headers, reintentos, backoff, compresion=None, columnar=False):
+    """
+    Envía un lote con los encabezados ya resueltos (se ejecuta en un hilo del pool,
+    donde no hay acceso a st.session_state). Reintenta con espera exponencial solo
+    cuando el servidor no llegó a procesar el lote: conexión no establecida o
+    502/503. Devuelve la última respuesta o None.
+    """
+    json_data, encabezados = preparar_cuerpo(lote, compresion=compresion, columnar=columnar)
+    headers = {**headers, **encabezados}
+    response = None
+    for intento in range(reintentos + 1):
+        try:
+            response = get_http_session().post(url, data=json_data, headers=headers, timeout=UPLOAD_TIMEOUT)
+            if response.status_code not in UPLOAD_RETRY_STATUS:
+                return response
+        except requests.exceptions.ConnectionError as error:
+            if not _sin_enviar(error):
+                # La conexión se cortó con la petición ya enviada: no se reenvía
+                return None
+            response = None
+        except requests.exceptions.ReadTimeout:
+            # El lote ya se envió y el servidor puede estar guardándolo: no se reenvía
+            return None
+        if intento < reintentos:
+            time.sleep(backoff * (2 ** intento))
+    return response
+
+
+def protected_post_por_lotes(url, registros, tamano_lote=UPLOAD_CHUNK_SIZE,
+                             max_workers=UPLOAD_MAX_WORKERS, reintentos=UPLOAD_MAX_RETRIES,
+                             backoff=UPLOAD_BACKOFF_SECONDS, on_progress=None,
+                             compresion=UPLOAD_COMPRESSION, columnar=UPLOAD_COLUMNAR,
+                             omitir=()):
+    """
+    Divide `registros` (lista de registros o DataFrame) en lotes y los envía en
+    paralelo con un pool acotado. Los lotes cuyo índice está en `omitir` (ya
+    guardados en un intento anterior) no se envían.
+    Devuelve la lista de respuestas en el orden de los lotes: None si el lote no
+    obtuvo respuesta o no se envió, y la excepción si no se pudo serializar.
+    `on_progress(enviados, total)` se llama desde el hilo de Streamlit a medida
+    que terminan los lotes. Si algún lote recibe 401, se renueva el token una vez
+    y se reenvían esos lotes. `compresion` y `columnar` se aplican a cada lote
+    (por defecto, la configuración UPLOAD_*).
+    """
+    if isinstance(registros, pd.DataFrame):
+        lotes = [registros.iloc[i:i + tamano_lote] for i in range(0, len(registros), tamano_lote)]
+    else:
+        lotes = [registros[i:i + tamano_lote] for i in range(0, len(registros), tamano_lote)]
+    respuestas = [None] * len(lotes)
+    pendientes = [i for i in range(len(lotes)) if i not in omitir]
+    total = len(pendientes)
+    enviados = 0
+
+    for ronda in range(2):
+        headers = get_auth_headers()
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futuros = {
+                pool.submit(_post_lote, url, lotes[i], headers, reintentos, backoff, compresion, columnar): i
+                for i in pendientes
+            }
+            for futuro in as_completed(futuros):
+                indice = futuros[futuro]
+                try:
+                    respuestas[indice] = futuro.result()
+                except RequestException:
+                    respuestas[indice] = None
+                except (TypeError, ValueError) as error:
+                    # Datos que no se pueden serializar: el lote queda como fallido
+                    respuestas[indice] = error
+                if ronda == 0:
+                    enviados += 1
+                    if on_progress is not None:
+                        on_progress(enviados, total)
+
+        pendientes = [i for i in pendientes
+                      if isinstance(respuestas[i], requests.Response) and respuestas[i].status_code == 401]
+        if not pendientes or ronda == 1 or not refresh_access_token(silent=True):
+            break
+
+    return respuestas
+
+
+def unir_respuestas_lotes(respuestas, guardados=None):
+    """
+    Combina las respuestas 201 de una carga por lotes: suma 'filas_guardadas' y
+    concatena 'resumen_procesado'. `guardados` ({índice: datos JSON}) son los
+    lotes guardados en intentos anteriores, que no se reenviaron (ver `omitir`
+    en protected_post_por_lotes): se incluyen en el resultado y el dict se
+    actualiza con los lotes guardados ahora. Devuelve (filas, resumen,
+    lotes_fallidos), donde lotes_fallidos es la lista de (índice, respuesta o
+    excepción) que no terminaron en 201.
+    """
+    guardados = {} if guardados is None else guardados
+    fallidos = []
+    for indice, response in enumerate(respuestas):
+        if indice in guardados:
+            continue
+        if isinstance(response, requests.Response) and response.status_code == 201:
+            guardados[indice] = response.json()
+        else:
+            fallidos.append((indice, response))
+
+    filas_guardadas = 0
+    resumen = []
+    for indice in sorted(guardados):
+        filas_guardadas += guardados[indice].get('filas_guardadas') or 0
+        resumen.extend(guardados[indice].get('resumen_procesado', []))
+    return filas_guardadas, resumen, fallidos
+
+
+
+def cargar_por_lotes(url, registros, clave):
+    """
+    Envía `registros` por lotes desde una página: muestra el progreso, los lotes
+    guardados y el error de cada lote fallido. `clave` identifica el archivo
+    cargado en st.session_state['lotes_guardados']; al volver a procesarlo solo
+    se reenvían los lotes que fallaron.
+    Devuelve (filas, resumen, lotes_fallidos) como unir_respuestas_lotes, o None
+    si la sesión expiró (ya cerrada) o el servidor respondió algo que no es JSON.
+    """
+    # Lotes de este archivo ya guardados ({índice: respuesta})
+    lotes_guardados = st.session_state.setdefault('lotes_guardados', {}).setdefault(clave, {})
+    barra = st.progress(0, text="Enviando lotes ....")
+    try:
+        respuestas = protected_post_por_lotes(
+            url, registros,
+            on_progress=lambda enviados, total: barra.progress(
+                enviados / total, text=f"Lotes enviados: {enviados}/{total}"
+            ),
+            omitir=lotes_guardados,
+        )
+        filas_guardadas, resumen, fallidos = unir_respuestas_lotes(respuestas, lotes_guardados)
+    except requests.exceptions.JSONDecodeError:
+        st.error("❌ Error API: El servidor devolvió una respuesta no válida.")
+        return None
+
+    if any(getattr(r, 'status_code', None) == 401 for _, r in fallidos):
+        st.error("❌ Sesión expirada o no autorizada. Por favor, inicie sesión de nuevo.")
+        logout_user()
+        return None
+
+    if filas_guardadas:
+        st.success(f"✅ Datos guardados. Filas: {filas_guardadas}")
+
+    if fallidos and lotes_guardados:
+        st.info(
+            f"Lotes guardados: {', '.join(str(i + 1) for i in sorted(lotes_guardados))}. "
+            "Al volver a procesar este archivo solo se reenvían los lotes que fallaron."
+        )
+    for indice, response in fallidos:
+        if response is None:
+            st.error(f"❌ Lote {indice + 1}: no se obtuvo respuesta del servidor. Revisa la conexión "
+                     "(si la conexión se cortó durante el envío, el lote pudo haberse guardado).")
+        elif isinstance(response, Exception):
+            st.error(f"❌ Lote {indice + 1}: los datos no se pudieron preparar para el envío ({response}).")
+        elif response.status_code == 400:
+            st.error(f"❌ Lote {indice + 1}: error de validación en Django. Verifique los detalles.")
+            try:
+                st.json(response.json())
+            except ValueError:
+                st.code(response.text)
+        else:
+            st.error(f"❌ Lote {indice + 1}: Error API {response.status_code}")
+            st.code(response.text)
+
+    if fallidos and resumen:
+        st.warning(f"⚠️ {len(fallidos)} lote(s) no se guardaron; el resumen es parcial.")
+    return filas_guardadas, resumen, fallidos
+
 # ===============================================================
 # 🔹 FORMULARIOS UI (para login / registro)
 # ===============================================================
@@ -235,7 +598,7 @@ def register_user(username, email, password, re_password):
         "re_password": re_password,
     }
     try:
-        response = requests.post(REGISTER_URL, json=data)
+        response = get_http_session().post(REGISTER_URL, json=data)
         if response.status_code == 201:
             st.success("🎉 Registro exitoso. Ahora puedes iniciar sesión.")
             return True
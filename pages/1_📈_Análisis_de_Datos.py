@@ -1,11 +1,22 @@
+import sys
+import os
+# Agrega la carpeta padre (FrontendStreamlit) al PATH.
+# Esto permite que Python encuentre el paquete 'procesamiento'.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import streamlit as st
-import numpy as np
 import pandas as pd
 import requests
-from urllib.parse import urlencode
 from datetime import datetime, timedelta
 # Importa tus funciones de autenticación
-from auth_logic import protected_get, protected_patch, DJANGO_API_BASE, logout_user 
+from auth_logic import protected_get_paginado, protected_patch, DJANGO_API_BASE, logout_user 
+from procesamiento.cache import consulta_en_cache, invalidar_consultas
+from procesamiento.particiones import (
+    consulta_incremental, invalidar_particiones, RECURSO_REPORTE, COLUMNAS_FECHA_REPORTE,
+)
+from procesamiento.edicion import (
+    construir_cambios, agrupar_cambios, dividir_en_lotes, aplicar_cambios, filas_canonicas,
+    filtrar_y_ordenar, combinar_pendientes, pendientes_a_cambios,
+)
 
 st.set_page_config(page_title="Análisis de Datos", layout="wide") 
 st.title("📈 Análisis de Datos")
@@ -18,6 +29,16 @@ API_PATCH_URL = DJANGO_API_BASE + "procesamiento/actualizar_picking_masivo/"
 DEFAULT_START_DATE = datetime.now().date() - timedelta(days=30)
 DEFAULT_END_DATE = datetime.now().date()
 
+# True: los cambios idénticos se envían agrupados {"ids": [...], "valores": {...}}
+# (requiere que actualizar_picking_masivo acepte ese formato)
+PATCH_AGRUPADO = False
+# True: tras un PATCH exitoso los cambios se aplican sobre los datos en memoria
+# y solo se vuelve a consultar Django si hay un conflicto
+PATCH_OPTIMISTA = True
+# El editor solo recibe una página de report_data a la vez
+TAMANOS_PAGINA_EDITOR = (100, 250, 500, 1000)
+SIN_ORDEN = "(sin orden)"
+
 # --- VERIFICACIÓN DE SESIÓN ---
 
 if not st.session_state.get('logged_in'):
@@ -30,109 +51,167 @@ if 'report_data' not in st.session_state:
     st.session_state['report_data'] = pd.DataFrame()
 if 'run_query' not in st.session_state:
     st.session_state['run_query'] = False
+if 'report_range' not in st.session_state:
+    st.session_state['report_range'] = None
+# Versión del editor: al cambiarla, st.data_editor arranca sin ediciones pendientes
+if 'editor_version' not in st.session_state:
+    st.session_state['editor_version'] = 0
+# Ediciones aún no guardadas, por id: {id: {campo: valor}} (sobreviven al cambiar de página)
+if 'ediciones_pendientes' not in st.session_state:
+    st.session_state['ediciones_pendientes'] = {}
 
 # --------------------------------------------------------------------------
 # --- FUNCIONES DE LÓGICA DE DATOS ---
 # --------------------------------------------------------------------------
-def convert_to_native_types(data):
-    """Convierte los tipos NumPy a tipos nativos de Python para la serialización JSON."""
-    
-    # 1. Manejo de tipos complejos (Listas y Diccionarios)
-    if isinstance(data, dict):
-        # Recursión en diccionarios
-        return {k: convert_to_native_types(v) for k, v in data.items()}
-    elif isinstance(data, list):
-        # Recursión en listas
-        return [convert_to_native_types(item) for item in data]
-    
-    # 2. Manejo de Valores Nulos (pd.NaT, np.nan, None)
-    elif pd.isna(data):
-        return None
-    
-    # 3. Manejo de Tipos Numéricos de NumPy
-    elif isinstance(data, (np.integer, np.int64)):
-        return int(data)
-    elif isinstance(data, (np.floating, np.float64)):
-        return float(data)
-    
-    # 4. Manejo de Tipos de Fecha de NumPy
-    elif isinstance(data, np.datetime64):
-        # Convertir a cadena de texto ISO para serialización
-        return str(data) 
-
-    # 5. Si no es un tipo especial, devolver el dato original
-    return data
+def fetch_filtered_data(fecha_inicio, fecha_fin, origen):
+    """
+    Consulta los datos filtrados usando la caché de consultas (por usuario,
+    con expiración). Si no hay una entrada vigente, arma el rango con los días
+    guardados localmente y pide a la API solo los días que faltan.
+    Devuelve un DataFrame o None si la API respondió con error.
+    """
+    usuario = st.session_state.get('username')
+    filtros = {"origen": origen}
+    return consulta_en_cache(
+        usuario, RECURSO_REPORTE, fecha_inicio, fecha_fin, filtros,
+        lambda: consulta_incremental(
+            usuario, RECURSO_REPORTE, fecha_inicio, fecha_fin, filtros,
+            lambda inicio, fin: _consultar_reporte(inicio, fin, origen),
+            COLUMNAS_FECHA_REPORTE,
+        ),
+    )
 
 
-@st.cache_data
-def fetch_filtered_data(fecha_inicio, fecha_fin, origen):
-    """Realiza la petición GET protegida con filtros dinámicos."""
+def _consultar_reporte(fecha_inicio, fecha_fin, origen):
+    """
+    Realiza la petición GET protegida con filtros dinámicos, leyendo el listado
+    por páginas. Devuelve un DataFrame o None si la API respondió con error.
+    """
     params = {}
     
   
     params["date_start"] = fecha_inicio.isoformat()
     params["date_end"] = fecha_fin.isoformat()
     
-    if origen:
-         params["origen"] = origen
+    if origen and origen.strip():
+         params["origen"] = origen.strip()
            
-    query_string = urlencode(params)
-    full_url = f"{API_URL}?{query_string}"
-    
-    response = protected_get(full_url)
-    
-    if response.status_code == 200:
-        return response.json()
-    elif response.status_code == 401:
-        st.error("❌ Sesión expirada. Por favor, inicie sesión de nuevo.")
-        logout_user()
-        return None
-    else: 
+    progreso = st.empty()
+    partes = []
+    try:
+        for parte in protected_get_paginado(API_URL, params):
+            partes.append(parte)
+            progreso.caption(f"Registros recibidos: {sum(len(p) for p in partes)}")
+    except requests.exceptions.HTTPError as e:
+        response = e.response
+        if response.status_code == 401:
+            st.error("❌ Sesión expirada. Por favor, inicie sesión de nuevo.")
+            logout_user()
+            return None
         st.error(f"Error al cargar datos: Código {response.status_code}.")
         try:
             st.code(response.json())
         except:
             st.code(response.text)
         return None
+    finally:
+        progreso.empty()
 
+    if not partes:
+        return pd.DataFrame()
+    return pd.concat(partes, ignore_index=True)
 
-def send_patch_request(original_df, changes):
-    
-    # 1. Crear la lista de cambios
-    patch_data = []
-    
-    # El diccionario 'edited_rows' contiene los cambios por índice de fila
-    for index_str, changed_values in changes['edited_rows'].items():
-        
-        index = int(index_str)
-        
-       
-        # Utilizamos .iloc para acceder a la fila por índice entero
-        registro_pk = original_df.iloc[index]['id'] 
-        registro_pk = int(registro_pk)
-        
-        
-        
-        # Construir el payload con el ID y solo los campos editados
-        payload = {"id": registro_pk} 
-        converted_changes = convert_to_native_types(changed_values)
-        
-        payload.update(converted_changes)
-        
-        # Añadir al lote
-        patch_data.append(payload) 
 
+def rango_fechas_editadas(original_df, cambios):
+    """
+    Rango de fechas (min, max) afectado por los cambios: las fechas originales de
+    las filas editadas y las fechas nuevas que se les asignan, en todas las
+    columnas de fecha. Si no hay ninguna, el rango de la consulta mostrada.
+    """
+    filas = original_df['id'].isin([cambio['id'] for cambio in cambios])
+    dias = []
+    for columna in COLUMNAS_FECHA_REPORTE:
+        if columna in original_df.columns:
+            dias.extend(pd.to_datetime(original_df.loc[filas, columna], errors='coerce').dropna().dt.date)
+        # Una fila que cambia de fecha también entra en las consultas de la fecha nueva
+        nuevas = [cambio[columna] for cambio in cambios if columna in cambio]
+        dias.extend(pd.to_datetime(pd.Series(nuevas, dtype=object), errors='coerce').dropna().dt.date)
+    if dias:
+        return min(dias), max(dias)
+    return st.session_state.get('report_range') or (None, None)
 
-    # 2. Enviar la petición PATCH masiva
+
+def aplicar_cambios_locales(cambios, canonicas):
+    """
+    Actualiza 'report_data' en memoria con los cambios aceptados (por id) y luego
+    con las filas que devolvió el servidor, que mandan sobre lo enviado.
+    Devuelve False si hay un conflicto (un id que no está en los datos mostrados)
+    y hay que volver a consultar.
+    """
+    df_actualizado, faltantes = aplicar_cambios(st.session_state['report_data'], cambios)
+    df_actualizado, faltantes_servidor = aplicar_cambios(df_actualizado, canonicas)
+    if faltantes or faltantes_servidor:
+        return False
+    st.session_state['report_data'] = df_actualizado
+    return True
+
+
+def send_patch_request(original_df, cambios):
+    
+    # 1. Los cambios llegan como [{"id": ..., campo: valor}] con solo lo editado
+    if not cambios:
+        st.info("No se detectaron celdas modificadas para guardar.")
+        return
+    patch_data = cambios
+    if PATCH_AGRUPADO:
+        patch_data = agrupar_cambios(cambios)
+
+    # 2. Enviar la petición PATCH masiva, en lotes si es muy grande
     with st.spinner("Enviando actualización a Django..."):
-        response = protected_patch(API_PATCH_URL, data=patch_data) 
+        lotes = dividir_en_lotes(patch_data)
+        aplicados = 0
+        canonicas = []
+        ids_con_error = []
+        for lote in lotes:
+            response = protected_patch(API_PATCH_URL, data=lote)
+            if response.status_code != 200:
+                break
+            aplicados += 1
+            try:
+                filas, errores = filas_canonicas(response.json())
+            except ValueError:
+                # Respuesta sin JSON: lo enviado se aplica tal cual
+                filas, errores = [], []
+            canonicas.extend(filas)
+            ids_con_error.extend(errores)
         
+        if aplicados:
+            # Solo se descartan las consultas cuyo rango incluye las filas editadas,
+            # también si un lote posterior falló (los anteriores ya se guardaron)
+            fecha_min, fecha_max = rango_fechas_editadas(original_df, cambios)
+            invalidar_consultas(RECURSO_REPORTE, fecha_min, fecha_max)
+            if fecha_min is not None:
+                invalidar_particiones(RECURSO_REPORTE, fecha_min, fecha_max)
+
         if response.status_code == 200:
-            st.success("🎉 ¡Datos actualizados con éxito! Recargando datos...")
-            fetch_filtered_data.clear()
-            st.session_state['run_query'] = True 
+            if ids_con_error:
+                st.warning(f"⚠️ El servidor rechazó los registros con id: {', '.join(map(str, ids_con_error))}.")
+            if PATCH_OPTIMISTA and not ids_con_error and aplicar_cambios_locales(cambios, canonicas):
+                st.success("🎉 ¡Datos actualizados con éxito!")
+            else:
+                st.success("🎉 ¡Datos actualizados con éxito! Recargando datos...")
+                # La consulta mostrada se vuelve a pedir completa
+                if st.session_state.get('report_range'):
+                    invalidar_consultas(RECURSO_REPORTE, *st.session_state['report_range'],
+                                        usuario=st.session_state.get('username'))
+                    invalidar_particiones(RECURSO_REPORTE, *st.session_state['report_range'])
+                st.session_state['run_query'] = True 
+            st.session_state['ediciones_pendientes'] = {}
+            st.session_state['editor_version'] += 1
             st.rerun() 
         else:
+            if aplicados:
+                st.warning(f"⚠️ Se aplicaron {aplicados} de {len(lotes)} lotes; vuelva a consultar antes de editar.")
             st.error(f"❌ Error al aplicar PATCH: Código {response.status_code}")
             try:
                 st.json(response.json())
@@ -145,26 +224,69 @@ def send_patch_request(original_df, changes):
 
 def display_data_editor(df_data: pd.DataFrame):
     st.subheader("Modificar Datos ")
-    
-    # Muestra el editor y guarda los cambios en st.session_state['data_editor']
+    pendientes = st.session_state['ediciones_pendientes']
+
+    # --- FILTRO, ORDEN Y PÁGINA (se resuelven aquí; al navegador solo va la página visible) ---
+    col_filtro, col_orden, col_asc, col_tamano = st.columns([2, 1, 1, 1])
+    with col_filtro:
+        texto = st.text_input("Buscar en los datos", key="editor_filtro")
+    with col_orden:
+        columna_orden = st.selectbox("Ordenar por", [SIN_ORDEN, *df_data.columns], key="editor_orden")
+    with col_asc:
+        ascendente = st.checkbox("Ascendente", value=True, key="editor_ascendente")
+    with col_tamano:
+        tamano_pagina = st.selectbox("Filas por página", TAMANOS_PAGINA_EDITOR, index=2, key="editor_tamano")
+
+    vista = filtrar_y_ordenar(
+        df_data, texto, None if columna_orden == SIN_ORDEN else columna_orden, ascendente
+    )
+    total_paginas = max(1, -(-len(vista) // tamano_pagina))
+    # Sin key: al cambiar el total de páginas el selector vuelve a la página 1
+    pagina = st.number_input("Página", min_value=1, max_value=total_paginas, value=1, step=1)
+    st.caption(f"{len(vista)} registros, página {pagina} de {total_paginas}.")
+
+    ventana = vista.iloc[(pagina - 1) * tamano_pagina: pagina * tamano_pagina]
+    # Las ediciones pendientes de esta página se muestran sobre los datos originales
+    ids_ventana = ventana['id'].tolist()
+    ventana, _ = aplicar_cambios(
+        ventana, [{'id': i, **pendientes[i]} for i in ids_ventana if i in pendientes]
+    )
+
+    # Muestra el editor; los cambios quedan en st.session_state[clave_editor]
+    firma = hash((texto, columna_orden, ascendente, tamano_pagina, pagina))
+    clave_editor = f"data_editor_{st.session_state['editor_version']}_{firma}"
     edited_df = st.data_editor(
-        df_data,
-        key="data_editor",
+        ventana,
+        key=clave_editor,
         use_container_width=True,
         hide_index=True,
         # Define los campos clave que no pueden ser modificados
         disabled=("id",)
     )
     
-    changes = st.session_state["data_editor"]
-    
+    # Las ediciones se guardan por id, así que no se pierden al cambiar de página
+    changes = st.session_state[clave_editor]
+    if changes.get('edited_rows'):
+        combinar_pendientes(
+            pendientes, construir_cambios(ventana, edited_df, filas=changes['edited_rows'].keys())
+        )
+
+    cambios = pendientes_a_cambios(pendientes)
+    if cambios:
+        st.caption(f"✏️ {len(cambios)} registro(s) con cambios sin guardar.")
+
+    col_guardar, col_descartar = st.columns([1, 1])
     # ✅ El botón de guardado debe estar aquí, después del st.data_editor
-    if st.button("Guardar Cambios Editados", type="primary"):
-        
-        if changes.get('edited_rows'):
-            send_patch_request(df_data, changes)
-        else:
-            st.info("No se detectaron celdas modificadas para guardar.")
+    with col_guardar:
+        guardar = st.button("Guardar Cambios Editados", type="primary")
+    with col_descartar:
+        if st.button("Descartar cambios", disabled=not cambios):
+            st.session_state['ediciones_pendientes'] = {}
+            st.session_state['editor_version'] += 1
+            st.rerun()
+
+    if guardar:
+        send_patch_request(df_data, cambios)
 
 # --------------------------------------------------------------------------
 # --- PÁGINA PRINCIPAL ---
@@ -201,15 +323,17 @@ def reporte_page():
             st.session_state['report_data'] = pd.DataFrame()
         else:
             with st.spinner("Consultando datos en Django..."):
-                data_json = fetch_filtered_data(fecha_inicio, fecha_fin, origen)
+                df_reporte = fetch_filtered_data(fecha_inicio, fecha_fin, origen)
+                st.session_state['report_range'] = (fecha_inicio, fecha_fin)
+                # Los datos cambiaron: las ediciones sin guardar ya no aplican
+                st.session_state['ediciones_pendientes'] = {}
                 
-                if data_json is None:
+                if df_reporte is None:
                     st.session_state['report_data'] = pd.DataFrame()
-                elif not data_json:
+                elif df_reporte.empty:
                     st.warning("No se encontraron registros para el rango de fechas seleccionado.")
                     st.session_state['report_data'] = pd.DataFrame()
                 else:
-                    df_reporte = pd.DataFrame(data_json)
                     st.session_state['report_data'] = df_reporte
                     st.success(f"Consulta exitosa. Se encontraron {len(df_reporte)} registros.")
 
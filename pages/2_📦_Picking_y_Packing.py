@@ -12,17 +12,22 @@ import requests
 from io import BytesIO
 from datetime import datetime
 #FUNCIONES PROPIAS
-from procesamiento.utils import to_excel_bultos, validation_data, convert_dates_to_iso, to_excel_regueros_por_origen
-from procesamiento.utilexport import BultosMasivo2, BultosMasivo, Regerospickingmasivo, RegerosSeleccion
+from procesamiento.utils import to_excel_bultos, validation_data, convert_dates_to_iso, to_excel_regueros_por_origen, a_categoricas
+from procesamiento.utilexport import CortePreparado
+from procesamiento.descargas import boton_descarga_diferida
+from procesamiento.ingesta import leer_archivo_en_pagina, derivado_en_cache, EXTENSIONES_ADMITIDAS
+from procesamiento.particiones import invalidar_registros_cargados
 
 #FUNCIONES DE AUTENTICACIÓN
-from auth_logic import protected_post, logout_user, DJANGO_API_BASE
+from auth_logic import protected_post, cargar_por_lotes, logout_user, DJANGO_API_BASE
 # Constante que usaremos como placeholder en lugar de NaN para la serialización
 
 st.set_page_config(page_title="Picking y Packing", layout="wide") 
 st.title("📦 Picking y Packing")
 
 NAN_PLACEHOLDER = "__NAN_PLACEHOLDER__"
+# Versión de la preparación para envío en la caché de archivos cargados (subir si cambia)
+VERSION_PICKING_ENVIO = 1
 
 DEFAULT_END_DATE = datetime.now().date()
 
@@ -62,6 +67,18 @@ def to_excel(df):
     return processed_data
 
 
+def corte_preparado(df_summary):
+    """
+    CortePreparado del resumen actual, guardado en la sesión: transformacionPicking
+    se calcula una vez por corte y cada reporte una vez.
+    """
+    corte = st.session_state.get('corte_preparado')
+    if corte is None or corte.origen is not df_summary:
+        corte = CortePreparado(df_summary)
+        st.session_state['corte_preparado'] = corte
+    return corte
+
+
 def display_summary_report():
 
     if not st.session_state['latest_summary'].empty:
@@ -95,36 +112,32 @@ def display_summary_report():
         
         with col1: 
         # --- 2. BOTÓN DE RUTA BULTOS ZONA PDF ---
-            dfbultosmasivo= BultosMasivo2(df_summary)
-            dfbultosmasivo2 = to_excel_bultos(dfbultosmasivo, "BULTOS POR ZONA")
-            st.download_button( 
-                    label="Descargar excel bultos zona", 
-                    data=dfbultosmasivo2,
-                    file_name='resumen_bultoszona.xlsx',
-                    mime='application/xlsx', 
-                    help='Descarga el resumen en excel del bultos por zona'
-                )
+            boton_descarga_diferida(
+                "bultos_zona", "BULTOS POR ZONA", df_summary,
+                lambda: to_excel_bultos(corte_preparado(df_summary).BultosMasivo2(), "BULTOS POR ZONA"),
+                label="Descargar excel bultos zona",
+                file_name='resumen_bultoszona.xlsx',
+                help='Descarga el resumen en excel del bultos por zona'
+            )
             
         with col2: 
         # --- 3. BOTÓN DE RUTA REGUEROS ZONA ---
-            dfregueros= RegerosSeleccion(df_summary)
-            dfregueros2 = to_excel_regueros_por_origen(dfregueros, "REGUEROS POR ZONA")
-            st.download_button( 
-                    label="Descargar excel regueros zona", 
-                    data=dfregueros2,
-                    file_name='resumen_regueroszona.xlsx',
-                    mime='application/xlsx', 
-                    help='Descarga el resumen en excel del regueros por zona'
-                )
+            boton_descarga_diferida(
+                "regueros_zona", "REGUEROS POR ZONA", df_summary,
+                lambda: to_excel_regueros_por_origen(corte_preparado(df_summary).RegerosSeleccion(), "REGUEROS POR ZONA"),
+                label="Descargar excel regueros zona",
+                file_name='resumen_regueroszona.xlsx',
+                help='Descarga el resumen en excel del regueros por zona'
+            )
 
      
         
-        info1 = df_summary.groupby(["codigoZona"])[["pesoUnitario","nombreAsociado", "origen"]].agg(
+        info1 = df_summary.groupby(["codigoZona"], observed=True)[["pesoUnitario","nombreAsociado", "origen"]].agg(
         Peso=("pesoUnitario", "sum"),
         Clientes= ("nombreAsociado", "nunique"),
         Ordenes=("origen", "nunique")).reset_index()
         
-        info2 = df_summary.groupby(["vendedor"])[["pesoUnitario","nombreAsociado", "origen"]].agg(
+        info2 = df_summary.groupby(["vendedor"], observed=True)[["pesoUnitario","nombreAsociado", "origen"]].agg(
         Peso=("pesoUnitario", "sum"),
         Clientes= ("nombreAsociado", "nunique"),
         Ordenes=("origen", "nunique")).reset_index()
@@ -143,11 +156,11 @@ def procesar_picking_packing(api_url):
     st.subheader(f"✅ Listo para cargar. Usando Corte: **{st.session_state['nombre_corte']}**")
     st.caption("el archivo plano no debe contener titulos, verifica que no los tenga")
 
-    uploaded_file = st.file_uploader("Cargar archivo XLSX", type=["xlsx"])
+    uploaded_file = st.file_uploader("Cargar archivo (XLSX, Parquet, Feather o CSV)", type=EXTENSIONES_ADMITIDAS)
 
     if uploaded_file:
         # 1. Lectura y preparación para envío
-        df_original = pd.read_excel(uploaded_file)
+        df_original, informe_lectura = leer_archivo_en_pagina(uploaded_file, "picking")
         #Revisión de los errores en datos
         revision_data = validation_data(df_original)
         
@@ -156,50 +169,33 @@ def procesar_picking_packing(api_url):
         else: 
            st.warning(revision_data)
         
-        df_para_envio = convert_dates_to_iso(df_original.copy())
-        df_para_envio = df_para_envio.replace({np.nan: NAN_PLACEHOLDER})
-        data_to_send = df_para_envio.to_dict(orient='records')
-        
- 
-        for record in data_to_send:
-            record['nombrecorte'] = st.session_state['corte_id']
+        # Preparación guardada en caché por huella del archivo: un rerun no la repite
+        df_para_envio = derivado_en_cache(
+            informe_lectura, "picking_envio", VERSION_PICKING_ENVIO,
+            lambda: convert_dates_to_iso(df_original.copy()).replace({np.nan: NAN_PLACEHOLDER}),
+        )
+        # Se envía el DataFrame directamente: auth_logic lo serializa por columnas
+        data_to_send = df_para_envio.assign(nombrecorte=st.session_state['corte_id'])
         
 
         if st.button("Procesar Picking y Packing", type="primary"):
             with st.spinner("Generando reportes ...."):
-                try:
-                    response = protected_post(api_url, data=data_to_send) 
-                    
-                    if response.status_code == 401:
-                         st.error("❌ Sesión expirada o no autorizada.")
-                         logout_user() 
-                         return
-                    
-                    response_data = response.json()
-                    
-                    if response.status_code == 201:
-                        # ✅ Aquí SÍ usamos el resumen porque esperamos data masiva
-                        st.success(f"✅ Datos guardados. Filas: {response_data.get('filas_guardadas')}")
-                        summary_data = response_data.get('resumen_procesado', [])
-                        
-                        if summary_data:
-                            df_summary = pd.DataFrame(summary_data)
-                            st.session_state['latest_summary'] = df_summary
-                            st.toast("Resumen de carga generado.")
-                            st.rerun() # Forzar rerun para mostrar el resumen de los datos
-
-                    elif response.status_code == 400:
-                        st.error("❌ Error de validación en Django. Verifique los detalles.")
-                        st.json(response_data)
-                    else:
-                        st.error(f"❌ Error API: {response.status_code}")
-                        st.code(response.text)
-                        
-                except requests.exceptions.ConnectionError:
-                    st.error("❌ Error de conexión. Revisa el servidor.")
-                except requests.exceptions.JSONDecodeError:
-                    st.error(f"❌ Error API: El servidor devolvió una respuesta no válida ({response.status_code}).")
-                    st.code(response.text)
+                resultado = cargar_por_lotes(
+                    api_url, data_to_send, (st.session_state['corte_id'], informe_lectura["huella"])
+                )
+                if resultado is None:
+                    return
+                filas_guardadas, summary_data, fallidos = resultado
+                if filas_guardadas:
+                    # Análisis no debe seguir mostrando consultas ni días guardados sin estas filas
+                    invalidar_registros_cargados(data_to_send)
+
+                if summary_data:
+                    # Columnas clave como 'category': menos memoria en la sesión
+                    st.session_state['latest_summary'] = a_categoricas(pd.DataFrame(summary_data))
+                    if not fallidos:
+                        st.toast("Resumen de carga generado.")
+                        st.rerun() # Forzar rerun para mostrar el resumen de los datos
 
 
 
@@ -13,10 +13,14 @@ import plotly.express as px
 from io import BytesIO
 from datetime import datetime
 #FUNCIONES PROPIAS
-from procesamiento.utils import convert_dates_to_iso, limpiar_y_preparar_detalle, to_excel
+from procesamiento.utils import convert_dates_to_iso, limpiar_y_preparar_detalle, to_excel, a_categoricas, sin_categoricas, resolver_marca
+from procesamiento.utilexport import unir_distintos
+from procesamiento.descargas import boton_descarga_diferida
+from procesamiento.ingesta import leer_archivo_en_pagina, derivado_en_cache, EXTENSIONES_ADMITIDAS
+from procesamiento.particiones import invalidar_registros_cargados
 
 #FUNCIONES DE AUTENTICACIÓN
-from auth_logic import protected_post, logout_user, DJANGO_API_BASE
+from auth_logic import cargar_por_lotes, DJANGO_API_BASE
 # Constante que usaremos como placeholder en lugar de NaN para la serialización
 
 NAN_PLACEHOLDER = "__NAN_PLACEHOLDER__"
@@ -73,6 +77,27 @@ def display_summary_report():
         st.subheader("Datos Agrupados")
         st.dataframe(df_agrupado, use_container_width=True, hide_index=True)
 
+# Versión de preparar_negados para la caché de archivos cargados (subir si cambia)
+VERSION_NEGADOS = 1
+
+
+def preparar_negados(df_original: pd.DataFrame) -> pd.DataFrame:
+    """Detalle de productos negados listo para mostrar y enviar."""
+    df_para_envio = convert_dates_to_iso(df_original.copy())
+
+    # Transformación de datos 
+    df_productonegado = limpiar_y_preparar_detalle(df_para_envio.copy())
+    df_productonegado = a_categoricas(convert_dates_to_iso(df_productonegado))
+    #Corrección de decimales
+    if 'cantidad_negada' in df_productonegado.columns:
+        df_productonegado['cantidad_negada'] = pd.to_numeric(
+            df_productonegado['cantidad_negada'], errors='coerce'
+        )
+        df_productonegado['cantidad_negada'].fillna(0, inplace=True)
+        df_productonegado['cantidad_negada'] = df_productonegado['cantidad_negada'].round(2)
+    return df_productonegado
+
+
 #Esta función es para guardar datos y no se pierda en los otros procesos
 if 'latest_summary' not in st.session_state:
     st.session_state['latest_summary'] = pd.DataFrame()
@@ -88,34 +113,29 @@ def main():
 
 
     #Carga de datos
-    uploaded_file = st.file_uploader("Cargar archivo XLSX", type=["xlsx"])
+    uploaded_file = st.file_uploader("Cargar archivo (XLSX, Parquet, Feather o CSV)", type=EXTENSIONES_ADMITIDAS)
 
     if uploaded_file:
         # 1. Lectura y preparación para envío
-        df_original = pd.read_excel(uploaded_file)
-        df_para_envio = convert_dates_to_iso(df_original.copy())
-        
-     
-        
-        # Transformación de datos 
-        df_productonegado = limpiar_y_preparar_detalle(df_para_envio.copy())
-        df_productonegado = convert_dates_to_iso(df_productonegado)
-        #Corrección de decimales
-        if 'cantidad_negada' in df_productonegado.columns:
-          
-            df_productonegado['cantidad_negada'] = pd.to_numeric(
-                df_productonegado['cantidad_negada'], errors='coerce'
-            )
-           
-            df_productonegado['cantidad_negada'].fillna(0, inplace=True)
-           
-            df_productonegado['cantidad_negada'] = df_productonegado['cantidad_negada'].round(2)
+        df_original, informe_lectura = leer_archivo_en_pagina(uploaded_file, "negados")
+        # Limpieza guardada en caché por huella del archivo: un rerun no la repite
+        df_productonegado = derivado_en_cache(
+            informe_lectura, "negados", VERSION_NEGADOS,
+            lambda: preparar_negados(df_original),
+        )
             
-        df_pn_visualizacion = df_productonegado.groupby(["marca", "producto"])[
-         ["cantidad_negada","origen", "referencia"]].agg(
-               cantidad_negada=("cantidad_negada", "sum"),
-               origen=("origen", lambda x: ", ".join(x.unique())),
-               referencia=("referencia", lambda x: ", ".join(x.unique()))).reset_index()
+        # Códigos de marca que no están en MARCA_MAP (quedan con el código como marca)
+        if 'producto' in df_productonegado.columns:
+            _, codigos_sin_marca = resolver_marca(df_productonegado['producto'])
+            if codigos_sin_marca:
+                st.caption(f"Códigos de marca sin nombre: {', '.join(codigos_sin_marca)}")
+
+        claves_pn = ["marca", "producto"]
+        df_pn_visualizacion = sin_categoricas(df_productonegado.groupby(claves_pn, observed=True)[["cantidad_negada"]].agg(
+               cantidad_negada=("cantidad_negada", "sum")
+        ).join(
+               unir_distintos(df_productonegado, claves_pn, {"origen": "origen", "referencia": "referencia"})
+        ).reset_index())
         
         # ----------------------------------------------------
         # BLOQUE DE VISUALIZACIÓN PREVIA Y BOTÓN DE PDF
@@ -138,62 +158,36 @@ def main():
             }
             
             # Botón de excel 
-            pdf_excel = to_excel(df_pn_visualizacion, "REPORTE DE NEGADOS - ANÁLISIS DE DATOS")
-            if pdf_excel: 
-                st.download_button( 
-                    label="Descargar Resumen a Excel", 
-                    data=pdf_excel,
-                    file_name='resumen_productonegado.xlsx',
-                    mime='application/xlsx', 
-                    help='Descarga el resumen en excel del producto negado'
-                )
+            boton_descarga_diferida(
+                "negados", "REPORTE DE NEGADOS - ANÁLISIS DE DATOS", df_pn_visualizacion,
+                lambda: to_excel(df_pn_visualizacion, "REPORTE DE NEGADOS - ANÁLISIS DE DATOS"),
+                label="Descargar Resumen a Excel",
+                file_name='resumen_productonegado.xlsx',
+                help='Descarga el resumen en excel del producto negado'
+            )
         
         # ----------------------------------------------------
         
    
-        data_to_send = df_productonegado.to_dict(orient='records')
-
+        data_to_send = df_productonegado
         if st.button("Procesar Producto negado", type="primary"):
             with st.spinner("Generando reportes ...."):
-                try:
-                    response = protected_post(API_URL, data=data_to_send)
-                    
-                    if response is None:
-                      st.error("❌ No se obtuvo respuesta del servidor. Verifica la conexión o el endpoint.")
-                      st.session_state['latest_summary'] = pd.DataFrame()
-                      return
-                     
-                    if response.status_code == 401:
-                        st.error("❌ Sesión expirada o no autorizada. Por favor, inicie sesión de nuevo.")
-                        logout_user() 
-                        return
-                    
-                    response_data = response.json()
-                    
-                    if response.status_code == 201:
-                        st.success(f"✅ Datos guardados. Filas: {response_data.get('filas_guardadas')}")
-                        summary_data = response_data.get('resumen_procesado', [])
-                        
-                        if summary_data:
-                            df_summary_result = pd.DataFrame(summary_data)
-                            # ✅ ALMACENAR DATOS FINALES PARA VISUALIZACIÓN
-                            st.session_state['latest_summary'] = df_summary_result
-                            st.toast("Resumen de carga generado.")
-                            st.rerun() # Forzar rerun para mostrar el gráfico
-
-                    elif response.status_code == 400:
-                        st.error("❌ Error de validación en Django. Verifique los detalles.")
-                        st.json(response_data)
-
-                    else:
-                        st.error(f"❌ Error API: {response.status_code}")
-                        st.code(response.text)
-                        
-                except requests.exceptions.ConnectionError:
-                    st.error("❌ Error de conexión. Revisa el servidor.")
-                except requests.exceptions.JSONDecodeError:
-                    st.error(f"❌ Error API: El servidor devolvió una respuesta no válida ({response.status_code}).")
-                    st.code(response.text)
+                resultado = cargar_por_lotes(API_URL, data_to_send, informe_lectura["huella"])
+                if resultado is None:
+                    return
+                filas_guardadas, summary_data, fallidos = resultado
+                if filas_guardadas:
+                    # Análisis no debe seguir mostrando consultas ni días guardados sin estas filas
+                    invalidar_registros_cargados(data_to_send)
+
+                if summary_data:
+                    # ✅ ALMACENAR DATOS FINALES PARA VISUALIZACIÓN
+                    st.session_state['latest_summary'] = pd.DataFrame(summary_data)
+                    if not fallidos:
+                        st.toast("Resumen de carga generado.")
+                        st.rerun() # Forzar rerun para mostrar el gráfico
+                elif fallidos and not filas_guardadas:
+                    st.session_state['latest_summary'] = pd.DataFrame()
 
     display_summary_report()
 
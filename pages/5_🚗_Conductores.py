@@ -11,8 +11,10 @@ import requests
 import json
 import plotly.express as px
 #FUNCIONES PROPIAS
-from procesamiento.utils import convert_dates_to_iso, to_excel, pickingPacking, to_excel_agrupado
-from procesamiento.utilexport import rutaPesodf, BultosMasivoConductores
+from procesamiento.utils import convert_dates_to_iso, to_excel, dividir_zona_serie, pickingPacking, to_excel_agrupado, a_categoricas
+from procesamiento.utilexport import rutaPesodf, BultosMasivoConductores, VERSION_RUTA_PESO, VERSION_CONDUCTORES
+from procesamiento.descargas import boton_descarga_diferida
+from procesamiento.ingesta import leer_archivo_en_pagina, derivado_en_cache, EXTENSIONES_ADMITIDAS
 #FUNCIONES DE AUTENTICACIÓN
 from auth_logic import logout_user
 
@@ -25,31 +27,11 @@ if not st.session_state.get('logged_in'):
     # El CSS oculta el enlace, pero este código impide que el contenido se cargue
     st.stop()
 
-def dividir_zona(zona):
-
-    if pd.isna(zona):  # Maneja valores NaN (Not a Number) o None si los hubiera
-        return [None, None]
-    try:
-        partes = str(zona).split(".", 1)  # Divide solo por el primer punto
-        if len(partes) == 1:
-            return [
-                partes[0],
-                None,
-            ]  # Si no hay punto, 'Cod zona' es la zona, 'zona' es None
-        else:
-            return partes
-    except:
-        return [None, None] 
-
 def display_summary_report(df_crudo: pd.DataFrame):
 
         st.markdown("Resumen de la información")
         
-        df_crudo[["Cod zona", "zona"]] = (
-        df_crudo["Asociado/Zona"]
-        .apply(dividir_zona)
-        .apply(pd.Series)
-    )
+        df_crudo[["Cod zona", "zona"]] = dividir_zona_serie(df_crudo["Asociado/Zona"])
         df_agrupadocod = df_crudo.groupby(["Cod zona"]).agg(
         Peso = ("Peso Total", "sum"),
         Clientes = ("Nombre de la empresa a mostrar en la factura", "nunique")
@@ -92,21 +74,23 @@ def main():
 
 
   #Carga de datos
-  uploaded_file = st.file_uploader("Cargar archivo XLSX", type=["xlsx"])
+  uploaded_file = st.file_uploader("Cargar archivo (XLSX, Parquet, Feather o CSV)", type=EXTENSIONES_ADMITIDAS)
 
   if uploaded_file:
     # 1. Lectura y preparación para envío
-    df_original = pd.read_excel(uploaded_file)
+    df_original, informe_lectura = leer_archivo_en_pagina(uploaded_file, "conductores")
     #Las bases de datos estandarizan la forma de utilizar los formatos fecha
-    df_para_envio = convert_dates_to_iso(df_original.copy())
+    df_para_envio = derivado_en_cache(
+        informe_lectura, "conductores_envio", VERSION_CONDUCTORES,
+        lambda: convert_dates_to_iso(df_original.copy()),
+    )
     
-    #Trasnformación de datos para visualización
-    df_zonapeso = rutaPesodf(df_para_envio)
-    # PASO CLAVE: Renombrar las columnas una vez
-    df_bultos_renombrado = pickingPacking(df_para_envio) 
-
-    # PASO CLAVE: Aplicar la lógica de bultos al DataFrame YA RENOMBRADO
-    df_bultos = BultosMasivoConductores(df_bultos_renombrado)
+    #Trasnformación de datos para visualización (en caché por huella del archivo;
+    # la comparte con Ruta y Peso, que genera el mismo resumen)
+    df_zonapeso = derivado_en_cache(
+        informe_lectura, "ruta_peso", VERSION_RUTA_PESO,
+        lambda: rutaPesodf(df_para_envio),
+    )
     
     total_clientes = df_zonapeso['Nombre de la empresa a mostrar en la factura'].nunique()
     total_peso = df_zonapeso['Peso Total'].sum()
@@ -139,23 +123,22 @@ def main():
           with st.spinner("Generando reportes ...."):
             display_summary_report(df_zonapeso)
     with col4:
-     df_zonapeso2 = to_excel(df_zonapeso, "REPORTE ZONA PESO")
-     st.download_button( 
-                    label="Descargar Resumen a Excel", 
-                    data=df_zonapeso2,
-                    file_name='resumen_rutapeso.xlsx',
-                    mime='application/xlsx', 
-                    help='Descarga el resumen en excel del zona peso'
-                )
+     boton_descarga_diferida(
+         "zona_peso", "REPORTE ZONA PESO", df_zonapeso,
+         lambda: to_excel(df_zonapeso, "REPORTE ZONA PESO"),
+         label="Descargar Resumen a Excel",
+         file_name='resumen_rutapeso.xlsx',
+         help='Descarga el resumen en excel del zona peso'
+     )
     with col5:
-     df_bultos2 = to_excel_agrupado(df_bultos, "REPORTE CONDUCTORES")
-     st.download_button( 
-                    label="Descargar Resumen Conductor", 
-                    data=df_bultos2,
-                    file_name='resumen_conductor.xlsx',
-                    mime='application/xlsx', 
-                    help='Descarga el resumen en excel del conductores'
-                )
+     # pickingPacking + BultosMasivoConductores solo se ejecutan al preparar la descarga
+     boton_descarga_diferida(
+         "conductores", "REPORTE CONDUCTORES", df_para_envio,
+         lambda: to_excel_agrupado(BultosMasivoConductores(a_categoricas(pickingPacking(df_para_envio))), "REPORTE CONDUCTORES"),
+         label="Descargar Resumen Conductor",
+         file_name='resumen_conductor.xlsx',
+         help='Descarga el resumen en excel del conductores'
+     )
     
    
        
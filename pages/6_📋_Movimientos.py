@@ -1,10 +1,15 @@
 import streamlit as st
 import pandas as pd
 import requests
-from auth_logic import protected_get, logout_user, DJANGO_API_BASE
+from auth_logic import protected_get_paginado, logout_user, DJANGO_API_BASE
 
 API_URL = DJANGO_API_BASE + "users/usuarios_movimientos/"
 
+# Se muestran primero los movimientos más recientes y solo hasta este límite
+# (si el endpoint no pagina, devuelve la lista completa y se muestra toda)
+MAX_MOVIMIENTOS = 5000
+ORDEN_MOVIMIENTOS = "-id"
+
 st.set_page_config(page_title="Movimientos", layout="wide") 
 st.title("📋 Movimientos del software")
 
@@ -16,6 +21,8 @@ if not st.session_state.get('logged_in'):
 # --- ESTADO DE DATOS ---
 if 'movimientos_data' not in st.session_state:
     st.session_state['movimientos_data'] = pd.DataFrame()
+if 'movimientos_truncados' not in st.session_state:
+    st.session_state['movimientos_truncados'] = False
 
 
 def main():
@@ -23,51 +30,55 @@ def main():
     # 1. BOTÓN DE CONSULTA
     if st.button("Consultar movimientos", type="primary"):
         with st.spinner("Generando reportes ...."):
+            estado = st.empty()
+            tabla = st.empty()
+            partes = []
+            descarga = {}
             try:
-                # La petición GET no requiere parámetros en la URL
-                response = protected_get(API_URL)
-                
-                if response is None:
-                    st.error("❌ No se obtuvo respuesta del servidor. Verifica la conexión o el endpoint.")
-                    return
-                
+                # 2. ✅ LECTURA POR PÁGINAS: se muestra cada página apenas llega
+                for parte in protected_get_paginado(
+                    API_URL, {"ordering": ORDEN_MOVIMIENTOS}, max_filas=MAX_MOVIMIENTOS, estado=descarga
+                ):
+                    partes.append(parte)
+                    df_parcial = pd.concat(partes, ignore_index=True)
+                    estado.caption(f"Cargando... {len(df_parcial)} movimientos recibidos.")
+                    tabla.dataframe(df_parcial, use_container_width=True, hide_index=True)
+
+                if partes:
+                    df_summary_result = pd.concat(partes, ignore_index=True)
+                    # ✅ GUARDAR EN ESTADO DE SESIÓN
+                    st.session_state['movimientos_data'] = df_summary_result
+                    st.session_state['movimientos_truncados'] = descarga["truncado"]
+                    st.success(f"Consulta exitosa. {len(df_summary_result)} movimientos encontrados.")
+                else:
+                    st.warning("No se encontraron movimientos registrados.")
+                    st.session_state['movimientos_data'] = pd.DataFrame()
+                    st.session_state['movimientos_truncados'] = False
+
+                # Forzar el redibujado para que el DataFrame aparezca fuera del botón
+                st.rerun() 
+
+            except requests.exceptions.HTTPError as e:
+                response = e.response
                 if response.status_code == 401:
                     st.error("❌ Sesión expirada o no autorizada. Por favor, inicie sesión de nuevo.")
                     logout_user() 
                     return
-                
-                # 2. ✅ MANEJO DE RESPUESTA Y CÓDIGO DE ESTADO
-                if response.status_code == 200: # <-- SE ESPERA 200 OK
-                    
-                    data_json = response.json()
-                    
-                    if data_json:
-                        df_summary_result = pd.DataFrame(data_json)
-                        # ✅ GUARDAR EN ESTADO DE SESIÓN
-                        st.session_state['movimientos_data'] = df_summary_result
-                        st.success(f"Consulta exitosa. {len(df_summary_result)} movimientos encontrados.")
-                    else:
-                        st.warning("No se encontraron movimientos registrados.")
-                        st.session_state['movimientos_data'] = pd.DataFrame()
-                
                 elif response.status_code == 404:
                     st.error("❌ Endpoint no encontrado. Revisa la URL del backend.")
                 else:
                     st.error(f"❌ Error API: Código {response.status_code}.")
-                    st.code(response.json())
-                    
-                # Forzar el redibujado para que el DataFrame aparezca fuera del botón
-                st.rerun() 
-                    
+                    st.code(response.text)
             except requests.exceptions.ConnectionError:
                 st.error("❌ Error de conexión. Revisa el servidor.")
             except requests.exceptions.JSONDecodeError:
                 st.error(f"❌ Error API: El servidor devolvió una respuesta no válida.")
-                st.code(response.text)
 
     # 3. VISUALIZACIÓN DEL DATAFRAME (Se ejecuta en cada rerun)
     if not st.session_state['movimientos_data'].empty:
         st.subheader("Historial de Actividad")
+        if st.session_state['movimientos_truncados']:
+            st.caption(f"Se muestran los {MAX_MOVIMIENTOS} movimientos más recientes.")
         st.dataframe(
             st.session_state['movimientos_data'], 
             use_container_width=True, 
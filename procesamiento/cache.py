@@ -0,0 +1,249 @@
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+from datetime import date
+from typing import Any, Callable, Optional, Union
+
+import pandas as pd
+from cachetools import LRUCache, TTLCache
+
+############ Caché de reportes generados (Excel) #######################################
+
+# Tamaño máximo (en bytes) de los archivos guardados en la caché, compartida
+# por todas las páginas y sesiones del proceso de Streamlit.
+MAX_BYTES_CACHE_REPORTES = 256 * 1024 * 1024
+
+_cache_reportes = LRUCache(maxsize=MAX_BYTES_CACHE_REPORTES, getsizeof=len)
+_lock_reportes = threading.Lock()
+
+
+def huella_dataframe(df: pd.DataFrame) -> str:
+    """
+    Calcula una huella (SHA-256) del contenido del DataFrame: valores, índice,
+    nombres de columnas y tipos. Dos DataFrames con el mismo contenido
+    producen la misma huella.
+    """
+    if not isinstance(df, pd.DataFrame):
+        raise TypeError("La función espera un objeto pd.DataFrame como entrada.")
+
+    huella = hashlib.sha256()
+    huella.update(repr(list(df.columns)).encode("utf-8"))
+    huella.update(repr(list(df.index.names)).encode("utf-8"))
+    huella.update(repr([str(t) for t in df.dtypes]).encode("utf-8"))
+    huella.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return huella.hexdigest()
+
+
+def _clave_reporte(tipo_reporte: str, base_titulo: str, huella: str) -> tuple:
+    # Los títulos incluyen la fecha de generación, por eso la fecha es parte de la clave
+    return (tipo_reporte, base_titulo, date.today().isoformat(), huella)
+
+
+def reporte_cacheado(tipo_reporte: str, base_titulo: str, huella: str) -> Optional[bytes]:
+    """Devuelve los bytes del reporte si ya están en la caché, sin generarlo."""
+    with _lock_reportes:
+        return _cache_reportes.get(_clave_reporte(tipo_reporte, base_titulo, huella))
+
+
+def reporte_en_cache(tipo_reporte: str, base_titulo: str, df: pd.DataFrame,
+                     generar: Callable[[], bytes], huella: Optional[str] = None) -> bytes:
+    """
+    Devuelve los bytes del reporte desde la caché o los genera con `generar()`.
+    La clave es el tipo de reporte, el título, la fecha del día y la huella
+    del DataFrame de entrada (se puede pasar `huella` si ya se calculó).
+    """
+    if huella is None:
+        huella = huella_dataframe(df)
+    clave = _clave_reporte(tipo_reporte, base_titulo, huella)
+
+    with _lock_reportes:
+        datos = _cache_reportes.get(clave)
+    if datos is not None:
+        return datos
+
+    datos = generar()
+
+    with _lock_reportes:
+        # Si el archivo supera el tamaño total de la caché, cachetools lo rechaza
+        if len(datos) <= _cache_reportes.maxsize:
+            _cache_reportes[clave] = datos
+    return datos
+
+
+def limpiar_cache_reportes() -> None:
+    """Vacía la caché de reportes."""
+    with _lock_reportes:
+        _cache_reportes.clear()
+
+
+############ Caché de consultas a la API ################################################
+
+# Las entradas expiran solas tras TTL_CACHE_CONSULTAS segundos; si se supera el
+# tamaño máximo (en bytes), se descartan primero las más antiguas.
+TTL_CACHE_CONSULTAS = 10 * 60
+MAX_BYTES_CACHE_CONSULTAS = 256 * 1024 * 1024
+
+
+def _bytes_consulta(datos: Any) -> int:
+    if isinstance(datos, pd.DataFrame):
+        return int(datos.memory_usage(deep=True).sum())
+    return sys.getsizeof(datos)
+
+
+_cache_consultas = TTLCache(maxsize=MAX_BYTES_CACHE_CONSULTAS, ttl=TTL_CACHE_CONSULTAS,
+                            getsizeof=_bytes_consulta)
+_lock_consultas = threading.Lock()
+
+
+def _normalizar_filtros(filtros: dict) -> tuple:
+    # Quita espacios y filtros vacíos para que " S001" y "S001" compartan entrada
+    normalizados = []
+    for nombre, valor in filtros.items():
+        if valor is None:
+            continue
+        valor = str(valor).strip()
+        if valor:
+            normalizados.append((nombre, valor))
+    return tuple(sorted(normalizados))
+
+
+def consulta_en_cache(usuario: str, recurso: str, fecha_inicio: date, fecha_fin: date,
+                      filtros: dict, obtener: Callable[[], Any]) -> Any:
+    """
+    Devuelve el resultado de una consulta por rango de fechas desde la caché o lo
+    obtiene con `obtener()`. La clave incluye el usuario, así que un usuario nunca
+    recibe resultados consultados por otro. Los resultados None (errores) no se guardan.
+    """
+    clave = (usuario, recurso, fecha_inicio, fecha_fin, _normalizar_filtros(filtros))
+
+    with _lock_consultas:
+        datos = _cache_consultas.get(clave)
+    if datos is not None:
+        return datos
+
+    datos = obtener()
+
+    if datos is not None:
+        with _lock_consultas:
+            # Una consulta mayor que toda la caché se devuelve sin guardar
+            if _bytes_consulta(datos) <= _cache_consultas.maxsize:
+                _cache_consultas[clave] = datos
+    return datos
+
+
+def invalidar_consultas(recurso: str, fecha_inicio: Optional[date] = None,
+                        fecha_fin: Optional[date] = None, usuario: Optional[str] = None) -> int:
+    """
+    Elimina las consultas de `recurso` cuyo rango de fechas se cruza con
+    [fecha_inicio, fecha_fin] (de todos los usuarios, salvo que se indique `usuario`).
+    Sin fechas se eliminan todas las del recurso. Devuelve cuántas se eliminaron.
+    """
+    with _lock_consultas:
+        claves = [
+            clave for clave in list(_cache_consultas.keys())
+            if clave[1] == recurso
+            and (usuario is None or clave[0] == usuario)
+            and (fecha_fin is None or clave[2] <= fecha_fin)
+            and (fecha_inicio is None or clave[3] >= fecha_inicio)
+        ]
+        for clave in claves:
+            _cache_consultas.pop(clave, None)
+    return len(claves)
+
+
+############ Caché de archivos cargados (DataFrames ya leídos y limpios) ################
+
+# Cada rerun de Streamlit vuelve a ejecutar la página completa; con esta caché el
+# mismo archivo (mismos bytes) no se vuelve a leer ni a transformar. La clave es
+# (huella del archivo, etapa, versión): al cambiar una transformación se sube su
+# versión y las entradas anteriores dejan de usarse.
+MAX_BYTES_CACHE_CARGAS = 512 * 1024 * 1024
+
+# Copia opcional en disco (Parquet): sobrevive a la expulsión de memoria y a los
+# reinicios del proceso. Se conservan solo los MAX_ARCHIVOS_CARGAS más recientes.
+GUARDAR_CARGAS_EN_DISCO = False
+DIRECTORIO_CARGAS = os.path.join(tempfile.gettempdir(), "logistica_cargas")
+MAX_ARCHIVOS_CARGAS = 50
+
+
+def _bytes_dataframe(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+
+_cache_cargas = LRUCache(maxsize=MAX_BYTES_CACHE_CARGAS, getsizeof=_bytes_dataframe)
+_lock_cargas = threading.Lock()
+
+
+def huella_bytes(contenido: bytes) -> str:
+    """SHA-256 del contenido de un archivo cargado."""
+    return hashlib.sha256(contenido).hexdigest()
+
+
+def _ruta_carga(clave: tuple) -> str:
+    huella, etapa, version = clave
+    return os.path.join(DIRECTORIO_CARGAS, f"{huella}_{etapa}_v{version}.parquet")
+
+
+def _leer_carga_disco(clave: tuple) -> Optional[pd.DataFrame]:
+    try:
+        return pd.read_parquet(_ruta_carga(clave))
+    except (OSError, ValueError):
+        return None
+
+
+def _guardar_carga_disco(clave: tuple, df: pd.DataFrame) -> None:
+    ruta = _ruta_carga(clave)
+    temporal = f"{ruta}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(DIRECTORIO_CARGAS, exist_ok=True)
+        df.to_parquet(temporal, index=True)
+        os.replace(temporal, ruta)
+    except (OSError, ValueError, TypeError):
+        # Columnas con tipos mezclados no se pueden guardar en Parquet
+        try:
+            os.remove(temporal)
+        except OSError:
+            pass
+        return
+
+    # Se borran los archivos más antiguos por encima del límite
+    try:
+        archivos = [os.path.join(DIRECTORIO_CARGAS, nombre) for nombre in os.listdir(DIRECTORIO_CARGAS)
+                    if nombre.endswith(".parquet")]
+        archivos.sort(key=os.path.getmtime, reverse=True)
+        for viejo in archivos[MAX_ARCHIVOS_CARGAS:]:
+            os.remove(viejo)
+    except OSError:
+        pass
+
+
+def carga_en_cache(huella: str, etapa: str, version: Union[int, str],
+                   generar: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+    """
+    Devuelve el DataFrame de la `etapa` (lectura o limpieza de una página) para
+    el archivo con esa `huella`, desde la caché o generándolo con `generar()`.
+    Siempre devuelve una copia: la página puede modificarla sin tocar la caché.
+    """
+    clave = (huella, etapa, version)
+
+    with _lock_cargas:
+        df = _cache_cargas.get(clave)
+    if df is None and GUARDAR_CARGAS_EN_DISCO:
+        df = _leer_carga_disco(clave)
+    if df is None:
+        df = generar()
+        if GUARDAR_CARGAS_EN_DISCO:
+            _guardar_carga_disco(clave, df)
+
+    with _lock_cargas:
+        if clave not in _cache_cargas and _bytes_dataframe(df) <= _cache_cargas.maxsize:
+            _cache_cargas[clave] = df
+    return df.copy()
+
+
+def limpiar_cache_cargas() -> None:
+    """Vacía la caché de archivos cargados en memoria."""
+    with _lock_cargas:
+        _cache_cargas.clear()
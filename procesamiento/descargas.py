@@ -0,0 +1,48 @@
+from typing import Callable, Optional
+
+import pandas as pd
+import streamlit as st
+
+from procesamiento.cache import huella_dataframe, reporte_cacheado, reporte_en_cache
+
+############ Descargas diferidas (se generan solo cuando el usuario las pide) ###########
+
+MIME_EXCEL = "application/xlsx"
+
+
+def boton_descarga_diferida(tipo_reporte: str, base_titulo: str, df: pd.DataFrame,
+                            generar: Callable[[], bytes], label: str, file_name: str,
+                            help: Optional[str] = None, mime: str = MIME_EXCEL) -> None:
+    """
+    Muestra un botón "Preparar" que genera el archivo solo al hacer clic y,
+    una vez listo, el st.download_button con los bytes guardados en la sesión.
+
+    Si el reporte ya está en la caché de reportes (mismo contenido, título y
+    fecha) se muestra directamente la descarga. Si el DataFrame cambia, el
+    archivo preparado se descarta y hay que volver a prepararlo.
+    """
+    huella = huella_dataframe(df)
+    estado = f"descarga_{tipo_reporte}"
+
+    preparado = st.session_state.get(estado)
+    if preparado is not None and preparado["huella"] != huella:
+        preparado = None
+
+    if preparado is None:
+        datos = reporte_cacheado(tipo_reporte, base_titulo, huella)
+        if datos is None:
+            if not st.button(f"Preparar: {label}", key=f"preparar_{tipo_reporte}", help=help):
+                return
+            with st.spinner("Generando archivo ...."):
+                datos = reporte_en_cache(tipo_reporte, base_titulo, df, generar, huella=huella)
+        preparado = {"huella": huella, "datos": datos}
+        st.session_state[estado] = preparado
+
+    st.download_button(
+        label=label,
+        data=preparado["datos"],
+        file_name=file_name,
+        mime=mime,
+        help=help,
+        key=f"descargar_{tipo_reporte}",
+    )
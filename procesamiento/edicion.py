@@ -0,0 +1,218 @@
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+############ Construcción de cambios (PATCH) a partir del editor de datos ##############
+
+# Registros por petición a actualizar_picking_masivo
+PATCH_CHUNK_SIZE = 500
+
+
+def _celdas_distintas(original: pd.Series, editado: pd.Series) -> np.ndarray:
+    """Máscara de celdas modificadas; dos nulos (NaN/None/NaT) se consideran iguales."""
+    nulo_original = original.isna().to_numpy()
+    nulo_editado = editado.isna().to_numpy()
+    if original.dtype == editado.dtype and original.dtype != object:
+        iguales = original.to_numpy() == editado.to_numpy()
+    else:
+        iguales = original.to_numpy(dtype=object) == editado.to_numpy(dtype=object)
+    return ~((nulo_original & nulo_editado) | (iguales & ~nulo_original & ~nulo_editado))
+
+
+def _valores_nativos(columna: pd.Series) -> list:
+    """Valores de la columna como tipos nativos de Python, serializables a JSON."""
+    if pd.api.types.is_datetime64_any_dtype(columna):
+        texto = columna.dt.strftime("%Y-%m-%dT%H:%M:%S")
+        return texto.where(columna.notna(), None).tolist()
+    return columna.astype(object).where(columna.notna(), None).tolist()
+
+
+def mascara_cambios(original: pd.DataFrame, editado: pd.DataFrame, columna_id: str = "id",
+                    filas: Optional[Iterable[int]] = None) -> pd.DataFrame:
+    """
+    Compara el DataFrame original con el devuelto por st.data_editor (mismo índice)
+    y devuelve la máscara booleana de celdas modificadas, solo con las filas que
+    tienen algún cambio. La columna de id no se compara.
+    `filas` (posiciones, p. ej. las claves de 'edited_rows') limita la comparación
+    a esas filas; las ediciones que vuelven al valor original se descartan.
+    """
+    columnas = [col for col in original.columns if col != columna_id and col in editado.columns]
+    if filas is not None:
+        original = original.iloc[sorted({int(f) for f in filas})]
+    editado = editado.reindex(original.index)
+    mascara = pd.DataFrame(
+        {col: _celdas_distintas(original[col], editado[col]) for col in columnas},
+        index=original.index,
+    )
+    return mascara[mascara.any(axis=1)]
+
+
+def construir_cambios(original: pd.DataFrame, editado: pd.DataFrame, columna_id: str = "id",
+                      filas: Optional[Iterable[int]] = None) -> List[dict]:
+    """
+    Devuelve la lista de cambios [{"id": ..., campo: valor, ...}] con solo las
+    columnas modificadas de cada fila (ver mascara_cambios para `filas`).
+    """
+    mascara = mascara_cambios(original, editado, columna_id, filas)
+    if mascara.empty:
+        return []
+
+    # Solo se convierten a tipos nativos las filas y columnas con cambios
+    columnas = mascara.columns[mascara.any(axis=0)]
+    editadas = editado.loc[mascara.index, columnas]
+    valores = {col: _valores_nativos(editadas[col]) for col in columnas}
+    marcas = {col: mascara[col].tolist() for col in columnas}
+    ids = [int(i) for i in original.loc[mascara.index, columna_id].tolist()]
+
+    cambios = []
+    for pos, registro_pk in enumerate(ids):
+        cambio = {columna_id: registro_pk}
+        for col in columnas:
+            if marcas[col][pos]:
+                cambio[col] = valores[col][pos]
+        cambios.append(cambio)
+    return cambios
+
+
+def agrupar_cambios(cambios: List[dict], columna_id: str = "id") -> List[dict]:
+    """
+    Une los cambios idénticos en una sola operación {"ids": [...], "valores": {...}}
+    (por ejemplo, el mismo conductor asignado a cientos de filas).
+    """
+    grupos = {}
+    for cambio in cambios:
+        valores = {campo: valor for campo, valor in cambio.items() if campo != columna_id}
+        clave = tuple(sorted(valores.items()))
+        grupos.setdefault(clave, {"ids": [], "valores": valores})["ids"].append(cambio[columna_id])
+    return list(grupos.values())
+
+
+def dividir_en_lotes(cambios: list, tamano_lote: int = PATCH_CHUNK_SIZE) -> List[list]:
+    """Divide la lista de cambios en lotes de hasta `tamano_lote` elementos."""
+    return [cambios[i:i + tamano_lote] for i in range(0, len(cambios), tamano_lote)]
+
+
+def _columna_actualizada(serie: pd.Series, posiciones: np.ndarray, valores: list) -> pd.Series:
+    """Devuelve una copia de `serie` con `valores` en `posiciones`, conservando el tipo si se puede."""
+    datos = serie.to_numpy(dtype=object, copy=True)
+    datos[posiciones] = valores
+    nueva = pd.Series(datos, index=serie.index, name=serie.name)
+
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return pd.to_datetime(nueva, errors="coerce")
+    hay_nulos = pd.isna(pd.Series(valores, dtype=object)).any()
+    if serie.dtype.kind in "biu" and hay_nulos:
+        # Enteros o booleanos con nulos: mismo resultado que al leer el JSON de la API
+        return pd.to_numeric(nueva, errors="coerce") if serie.dtype.kind != "b" else nueva
+    try:
+        return nueva.astype(serie.dtype)
+    except (TypeError, ValueError):
+        return nueva.infer_objects()
+
+
+def aplicar_cambios(df: pd.DataFrame, cambios: List[dict], columna_id: str = "id"):
+    """
+    Aplica sobre una copia de `df` una lista de cambios [{"id": ..., campo: valor}]
+    buscando cada fila por id (no por posición). Los campos que no son columnas
+    de `df` se ignoran. Devuelve (df_actualizado, ids_no_encontrados).
+    """
+    if not cambios:
+        return df, []
+
+    ids = pd.Index(df[columna_id])
+    posiciones = ids.get_indexer([cambio[columna_id] for cambio in cambios])
+    faltantes = [cambio[columna_id] for cambio, pos in zip(cambios, posiciones) if pos < 0]
+
+    # Se agrupan los valores por columna para actualizar cada columna una sola vez
+    por_columna = {}
+    for cambio, pos in zip(cambios, posiciones):
+        if pos < 0:
+            continue
+        for campo, valor in cambio.items():
+            if campo != columna_id and campo in df.columns:
+                por_columna.setdefault(campo, ([], []))
+                por_columna[campo][0].append(pos)
+                por_columna[campo][1].append(valor)
+
+    df = df.copy()
+    for campo, (pos, valores) in por_columna.items():
+        df[campo] = _columna_actualizada(df[campo], np.asarray(pos), valores)
+    return df, faltantes
+
+
+# Claves que marcan un error por id en la respuesta del PATCH: en el registro
+# ({"id": 3, "error": ...}) o como nombre de la lista ({"errores": [{"id": 3}]})
+CLAVES_ERROR_PATCH = ("error", "errors", "errores", "detail")
+
+
+def filas_canonicas(respuesta, columna_id: str = "id"):
+    """
+    Separa la respuesta JSON de un PATCH exitoso en las filas devueltas por el
+    servidor (registros con id, en una lista directa o dentro de un objeto) y los
+    ids rechazados (registros marcados con CLAVES_ERROR_PATCH). Las filas solo
+    sirven para conciliar lo aplicado en local; una respuesta sin registros
+    (p. ej. {"status": "ok"}) no trae ninguna. Devuelve (filas, ids_con_error).
+    """
+    listas = []
+    if isinstance(respuesta, list):
+        listas.append((respuesta, False))
+    elif isinstance(respuesta, dict):
+        listas.extend((valor, clave in CLAVES_ERROR_PATCH) for clave, valor in respuesta.items()
+                      if isinstance(valor, list))
+
+    filas, ids_con_error = [], []
+    for registros, son_errores in listas:
+        for registro in registros:
+            if not isinstance(registro, dict) or columna_id not in registro:
+                continue
+            if son_errores or any(clave in registro for clave in CLAVES_ERROR_PATCH):
+                ids_con_error.append(registro[columna_id])
+            else:
+                filas.append(registro)
+    return filas, ids_con_error
+
+
+############ Editor por ventanas (filtrado, orden y página) #############################
+
+def filtrar_y_ordenar(df: pd.DataFrame, texto: str = "", columna_orden: Optional[str] = None,
+                      ascendente: bool = True) -> pd.DataFrame:
+    """
+    Filtra las filas que contienen `texto` (sin distinguir mayúsculas) en alguna
+    columna de texto y las ordena por `columna_orden`. No copia los datos si no
+    hay filtro ni orden.
+    """
+    texto = (texto or "").strip()
+    if texto:
+        coincide = np.zeros(len(df), dtype=bool)
+        for col in df.columns[df.dtypes == object]:
+            columna = df[col]
+            if pd.api.types.infer_dtype(columna, skipna=True) != "string":
+                # Booleanos o valores mezclados (p. ej. nulos de la API): se busca
+                # en su forma de texto, sin que los nulos coincidan con "nan"
+                columna = columna.astype(str).where(columna.notna())
+            coincide |= columna.str.contains(texto, case=False, regex=False, na=False).to_numpy(dtype=bool)
+        df = df[coincide]
+    if columna_orden and columna_orden in df.columns:
+        try:
+            df = df.sort_values(columna_orden, ascending=ascendente, kind="stable", na_position="last")
+        except TypeError:
+            # Tipos mezclados (p. ej. números y texto): se ordena por su forma de texto
+            df = df.sort_values(
+                columna_orden, ascending=ascendente, kind="stable", na_position="last",
+                key=lambda columna: columna.astype(str).where(columna.notna()),
+            )
+    return df
+
+
+def combinar_pendientes(pendientes: dict, cambios: List[dict], columna_id: str = "id") -> dict:
+    """Acumula cambios en {id: {campo: valor}}; la última edición de cada campo manda."""
+    for cambio in cambios:
+        campos = {campo: valor for campo, valor in cambio.items() if campo != columna_id}
+        pendientes.setdefault(cambio[columna_id], {}).update(campos)
+    return pendientes
+
+
+def pendientes_a_cambios(pendientes: dict, columna_id: str = "id") -> List[dict]:
+    """Convierte {id: {campo: valor}} en la lista de cambios [{"id": ..., campo: valor}]."""
+    return [{columna_id: registro_pk, **campos} for registro_pk, campos in pendientes.items() if campos]
@@ -0,0 +1,344 @@
+import io
+import time
+from typing import Callable, Dict, Optional, Tuple, Union
+
+import pandas as pd
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+import streamlit as st
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
+from pandas.io.parsers import TextParser
+
+from procesamiento.cache import carga_en_cache, huella_bytes
+from procesamiento.utils import COLUMNAS_FINALES_MAPEO
+
+try:
+    import python_calamine  # noqa: F401  (motor opcional, lo usa pandas >= 2.2)
+    HAY_CALAMINE = True
+except ImportError:
+    HAY_CALAMINE = False
+
+############ Lectura de los archivos cargados en las páginas ############################
+
+# Además del XLSX exportado de Odoo se aceptan Parquet, Feather y CSV con los
+# mismos nombres de columna; el formato se detecta por el contenido.
+EXTENSIONES_ADMITIDAS = ["xlsx", "parquet", "feather", "csv"]
+
+# Columnas que usa cada página. El resto de columnas del export de Odoo se
+# descarta al leer, sin convertir sus celdas.
+PREFIJO_NEGADOS = "Movimientos de Existencias/"
+
+COLUMNAS_RUTA_PESO = [
+    "Nombre de la empresa a mostrar en la factura",
+    "Asociado/Ciudad",
+    "Asociado/Zona",
+    "Vendedor",
+    "Origen",
+    "ID",
+    "Peso Total",
+]
+
+# Solo se fijan de antemano los tipos de las medidas decimales; el resto de
+# columnas conserva la inferencia de pd.read_excel (enteros, fechas, texto).
+TIPOS_MEDIDAS = {
+    "Líneas de factura/Producto/Peso": "float64",
+    "Peso Total": "float64",
+    "Movimientos de Existencias/Cantidad Real": "float64",
+    "Movimientos de Existencias/Cantidad Reservada": "float64",
+}
+
+# Columnas de fecha: en CSV llegan como texto y se convierten al leer, para que
+# convert_dates_to_iso las trate igual que las del XLSX
+COLUMNAS_FECHA = ["Fecha de Factura/Recibo", "Fecha Programada"]
+
+# Cada especificación indica las columnas por nombre exacto y/o por prefijo
+ESPECIFICACIONES = {
+    "picking": {"columnas": list(COLUMNAS_FINALES_MAPEO)},
+    "negados": {
+        "columnas": ["Fecha Programada", "Documento Origen", "Referencia"],
+        "prefijos": [PREFIJO_NEGADOS],
+    },
+    "ruta_peso": {"columnas": COLUMNAS_RUTA_PESO},
+    # Conductores muestra ruta y peso y además genera el reporte de picking
+    "conductores": {"columnas": list(dict.fromkeys(COLUMNAS_RUTA_PESO + list(COLUMNAS_FINALES_MAPEO)))},
+}
+
+# La lectura que se guarda en caché incluye las columnas de todas las páginas:
+# así el mismo export cargado en Ruta y Peso y en Conductores se lee una sola vez.
+# Subir la versión si cambia la lectura (columnas, tipos o conversión de celdas).
+VERSION_LECTURA = 2
+_TODAS = {
+    "columnas": list(dict.fromkeys(col for esp in ESPECIFICACIONES.values() for col in esp.get("columnas", []))),
+    "prefijos": list(dict.fromkeys(pre for esp in ESPECIFICACIONES.values() for pre in esp.get("prefijos", []))),
+}
+
+
+def _seleccion(especificacion: dict) -> Callable[[str], bool]:
+    columnas = set(especificacion.get("columnas", []))
+    prefijos = tuple(especificacion.get("prefijos", []))
+    return lambda nombre: nombre in columnas or (bool(prefijos) and str(nombre).startswith(prefijos))
+
+
+def _contenido(archivo) -> bytes:
+    # Acepta rutas, bytes o archivos (p. ej. el UploadedFile de Streamlit)
+    if isinstance(archivo, (bytes, bytearray)):
+        return bytes(archivo)
+    if isinstance(archivo, str):
+        with open(archivo, "rb") as fh:
+            return fh.read()
+    if hasattr(archivo, "getvalue"):
+        return archivo.getvalue()
+    archivo.seek(0)
+    return archivo.read()
+
+
+# --- Motores ---
+# Cada motor recibe (contenido, selección de columnas, tipos) y devuelve el
+# DataFrame con solo las columnas seleccionadas, en el orden del archivo.
+
+def _valor_celda(valor):
+    # Misma conversión que el lector openpyxl de pandas
+    if valor is None:
+        return ""
+    if type(valor) is float:
+        entero = int(valor)
+        return entero if entero == valor else valor
+    if type(valor) is str and valor in ERROR_CODES:
+        return float("nan")
+    return valor
+
+
+def _leer_streaming(contenido: bytes, seleccion: Callable[[str], bool], tipos: Optional[dict]) -> pd.DataFrame:
+    """
+    Recorre la hoja en modo solo lectura (values_only) y convierte únicamente las
+    celdas de las columnas seleccionadas. La inferencia de tipos es la misma de
+    pd.read_excel (TextParser), así que el resultado es idéntico.
+    """
+    libro = load_workbook(io.BytesIO(contenido), read_only=True, data_only=True, keep_links=False)
+    try:
+        hoja = libro.worksheets[0]
+        hoja.reset_dimensions()
+        filas = hoja.iter_rows(values_only=True)
+        encabezado = next(filas, None)
+        if encabezado is None:
+            return pd.DataFrame()
+
+        posiciones = [i for i, nombre in enumerate(encabezado) if nombre is not None and seleccion(nombre)]
+        nombres = [encabezado[i] for i in posiciones]
+
+        datos = [nombres]
+        ultima_con_datos = 0
+        for fila in filas:
+            if fila.count(None) != len(fila):
+                ultima_con_datos = len(datos)
+            ancho = len(fila)
+            datos.append([_valor_celda(fila[i]) if i < ancho else "" for i in posiciones])
+    finally:
+        libro.close()
+
+    # Igual que pandas: se quitan las filas vacías del final de la hoja
+    datos = datos[:ultima_con_datos + 1]
+    tipos = {col: tipo for col, tipo in (tipos or {}).items() if col in nombres}
+    return TextParser(datos, header=0, dtype=tipos or None, skip_blank_lines=False).read()
+
+
+def _leer_pandas(motor: str) -> Callable[[bytes, Callable[[str], bool], Optional[dict]], pd.DataFrame]:
+    def leer(contenido: bytes, seleccion: Callable[[str], bool], tipos: Optional[dict]) -> pd.DataFrame:
+        return pd.read_excel(io.BytesIO(contenido), engine=motor, usecols=seleccion, dtype=tipos)
+    return leer
+
+
+MOTORES: Dict[str, Callable[[bytes, Callable[[str], bool], Optional[dict]], pd.DataFrame]] = {
+    "streaming": _leer_streaming,
+    "openpyxl": _leer_pandas("openpyxl"),
+}
+if HAY_CALAMINE:
+    MOTORES["calamine"] = _leer_pandas("calamine")
+
+# Motor por defecto: calamine (Rust) si está instalado
+MOTOR_EXCEL = "calamine" if HAY_CALAMINE else "streaming"
+
+
+# --- Formatos columnares y CSV ---
+
+def detectar_formato(contenido: bytes) -> str:
+    """Formato del archivo según sus primeros bytes: xlsx, parquet, feather o csv."""
+    if contenido[:4] == b"PK\x03\x04":
+        return "xlsx"
+    if contenido[:4] == b"PAR1":
+        return "parquet"
+    if contenido[:6] == b"ARROW1":
+        return "feather"
+    return "csv"
+
+
+def _con_tipos(df: pd.DataFrame, tipos: Optional[dict]) -> pd.DataFrame:
+    # Parquet y Feather ya traen tipos; solo se igualan las medidas al XLSX
+    tipos = {col: tipo for col, tipo in (tipos or {}).items() if col in df.columns and df[col].dtype != tipo}
+    return df.astype(tipos) if tipos else df
+
+
+def _leer_parquet(contenido: bytes, seleccion: Callable[[str], bool], tipos: Optional[dict]) -> pd.DataFrame:
+    # Solo se leen del archivo las columnas seleccionadas
+    columnas = [col for col in pq.read_schema(io.BytesIO(contenido)).names if seleccion(col)]
+    return _con_tipos(pd.read_parquet(io.BytesIO(contenido), columns=columnas), tipos)
+
+
+def _leer_feather(contenido: bytes, seleccion: Callable[[str], bool], tipos: Optional[dict]) -> pd.DataFrame:
+    columnas = [col for col in ipc.open_file(io.BytesIO(contenido)).schema.names if seleccion(col)]
+    return _con_tipos(pd.read_feather(io.BytesIO(contenido), columns=columnas), tipos)
+
+
+def _separador_csv(texto: str) -> str:
+    # Odoo exporta con coma; Excel en español guarda con punto y coma
+    encabezado = texto.split("\n", 1)[0]
+    return max([",", ";", "\t"], key=encabezado.count)
+
+
+def _codificacion_csv(contenido: bytes) -> str:
+    # Odoo exporta en UTF-8; Excel en Windows guarda en cp1252
+    try:
+        contenido.decode("utf-8-sig")
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "cp1252"
+
+
+# Formatos de fecha aceptados en CSV, en orden: el de Odoo (ISO) y los de Excel
+# en español (día primero)
+FORMATOS_FECHA_CSV = ["ISO8601", "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y"]
+
+
+def _fechas_csv(serie: pd.Series) -> pd.Series:
+    for formato in FORMATOS_FECHA_CSV:
+        try:
+            return pd.to_datetime(serie, format=formato)
+        except (ValueError, TypeError):
+            continue
+    return pd.to_datetime(serie, dayfirst=True, errors="coerce")
+
+
+def _leer_csv(contenido: bytes, seleccion: Callable[[str], bool], tipos: Optional[dict]) -> pd.DataFrame:
+    codificacion = _codificacion_csv(contenido)
+    separador = _separador_csv(contenido[:64 * 1024].decode(codificacion, errors="ignore"))
+    # Con punto y coma (Excel en español) los decimales vienen con coma: "2,5"
+    decimal = "," if separador == ";" else "."
+    df = pd.read_csv(
+        io.BytesIO(contenido), sep=separador, encoding=codificacion, decimal=decimal,
+        usecols=seleccion, dtype=tipos,
+    )
+    for col in COLUMNAS_FECHA:
+        if col in df.columns:
+            df[col] = _fechas_csv(df[col])
+    return df
+
+
+LECTORES = {
+    "parquet": _leer_parquet,
+    "feather": _leer_feather,
+    "csv": _leer_csv,
+}
+
+
+def _leer(contenido: bytes, especificacion: dict, formato: str, motor: str) -> pd.DataFrame:
+    seleccion = _seleccion(especificacion)
+    leer = MOTORES[motor] if formato == "xlsx" else LECTORES[formato]
+    try:
+        return leer(contenido, seleccion, TIPOS_MEDIDAS)
+    except ValueError:
+        # Una medida con texto no admite el tipo fijado: se lee con inferencia
+        return leer(contenido, seleccion, None)
+
+
+def leer_archivo(archivo, tipo: str, motor: Optional[str] = None,
+                 usar_cache: bool = True) -> Tuple[pd.DataFrame, dict]:
+    """
+    Lee el archivo cargado (XLSX, Parquet, Feather o CSV, según su contenido)
+    con solo las columnas que necesita la página `tipo` (ver ESPECIFICACIONES).
+    `motor` elige el lector de XLSX (ver MOTORES). Devuelve (df, informe) con
+    el formato, el motor usado, filas, segundos, filas por segundo, las
+    columnas esperadas que no están en el archivo y la huella (SHA-256).
+
+    Con `usar_cache` la lectura se guarda por huella del archivo y un rerun con
+    el mismo archivo no lo vuelve a leer (el informe indica motor "caché").
+    """
+    if tipo not in ESPECIFICACIONES:
+        raise ValueError(f"Tipo de archivo desconocido: {tipo}")
+    motor = motor or MOTOR_EXCEL
+    if motor not in MOTORES:
+        raise ValueError(f"Motor de lectura no disponible: {motor}")
+
+    especificacion = ESPECIFICACIONES[tipo]
+    contenido = _contenido(archivo)
+    huella = huella_bytes(contenido)
+    formato = detectar_formato(contenido)
+    if formato != "xlsx":
+        motor = formato
+
+    inicio = time.perf_counter()
+    if usar_cache:
+        leidos = []
+
+        def leer_todas() -> pd.DataFrame:
+            leidos.append(motor)
+            return _leer(contenido, _TODAS, formato, motor)
+
+        df = carga_en_cache(huella, "lectura", VERSION_LECTURA, leer_todas)
+        seleccion = _seleccion(especificacion)
+        df = df[[col for col in df.columns if seleccion(col)]]
+        motor_usado = motor if leidos else "caché"
+    else:
+        df = _leer(contenido, especificacion, formato, motor)
+        motor_usado = motor
+    segundos = time.perf_counter() - inicio
+
+    informe = {
+        "formato": formato,
+        "motor": motor_usado,
+        "filas": len(df),
+        "columnas": len(df.columns),
+        "segundos": segundos,
+        "filas_por_segundo": len(df) / segundos if segundos > 0 else float("inf"),
+        "faltantes": [col for col in especificacion.get("columnas", []) if col not in df.columns],
+        "huella": huella,
+    }
+    return df, informe
+
+
+def comparar_motores(archivo, tipo: str) -> pd.DataFrame:
+    """Lee el mismo XLSX con cada motor disponible y devuelve sus tiempos."""
+    contenido = _contenido(archivo)
+    informes = [leer_archivo(contenido, tipo, motor, usar_cache=False)[1] for motor in MOTORES]
+    return pd.DataFrame(informes).drop(columns=["faltantes", "huella"]).sort_values("segundos", ignore_index=True)
+
+
+def resumen_lectura(informe: dict) -> str:
+    """Texto corto con el rendimiento de la lectura, para mostrar en la página."""
+    return (
+        f"Archivo {informe['formato'].upper()} leído: {informe['filas']:,} filas en {informe['segundos']:.1f} s "
+        f"({informe['filas_por_segundo']:,.0f} filas/s, motor {informe['motor']})"
+    )
+
+
+def derivado_en_cache(informe: dict, etapa: str, version: Union[int, str], generar: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+    """
+    carga_en_cache para una etapa derivada de la lectura (limpieza o preparación
+    de una página) del archivo de `informe`. La clave incluye VERSION_LECTURA
+    además de la `version` de la etapa: si cambia la lectura, los DataFrames
+    derivados guardados (también en disco) dejan de usarse.
+    """
+    return carga_en_cache(informe["huella"], etapa, f"{VERSION_LECTURA}.{version}", generar)
+
+
+def leer_archivo_en_pagina(archivo, tipo: str) -> Tuple[pd.DataFrame, dict]:
+    """
+    Lee el archivo cargado en una página con leer_archivo, muestra el resumen de
+    la lectura y avisa de las columnas esperadas que no están en el archivo.
+    Devuelve (df, informe); las columnas faltantes quedan en informe["faltantes"].
+    """
+    df, informe = leer_archivo(archivo, tipo)
+    st.caption(resumen_lectura(informe))
+    if informe["faltantes"]:
+        st.warning(f"Columnas no encontradas en el archivo: {', '.join(informe['faltantes'])}")
+    return df, informe
@@ -0,0 +1,278 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from typing import Callable, Iterable, Optional, Union
+
+import pandas as pd
+
+from procesamiento.cache import invalidar_consultas
+
+############ Almacén local de consultas particionado por día (Parquet) ##################
+
+# Cada día consultado se guarda como un archivo Parquet:
+#   DIRECTORIO_PARTICIONES/<usuario>/<recurso>/<filtros>/AAAA-MM-DD.parquet
+# Un rango de fechas se arma leyendo los días guardados y pidiendo a la API solo
+# los días que faltan o que ya no están vigentes.
+# Los archivos tienen datos de cada usuario: el directorio es privado (0o700) y
+# se puede cambiar con la variable de entorno LOGISTICA_DIR_PARTICIONES.
+_SUFIJO_USUARIO_SO = os.getuid() if hasattr(os, "getuid") else "app"
+DIRECTORIO_PARTICIONES = os.environ.get("LOGISTICA_DIR_PARTICIONES") or os.path.join(
+    tempfile.gettempdir(), f"logistica_particiones_{_SUFIJO_USUARIO_SO}"
+)
+
+# Recurso del reporte de Análisis (reporte_datos) y columnas de fecha de sus
+# registros, usadas para invalidar solo los rangos afectados
+RECURSO_REPORTE = "reporte_datos"
+COLUMNAS_FECHA_REPORTE = ("fechaFactura", "fecha")
+
+# Los últimos días siguen recibiendo datos: siempre se vuelven a consultar
+DIAS_SIEMPRE_FRESCOS = 2
+# Tiempo máximo (segundos) que un día guardado se considera vigente
+VIGENCIA_PARTICION = 12 * 60 * 60
+
+# Límites del almacén: se borran los días guardados hace más de MAX_EDAD_PARTICION
+# segundos y, si aun así se supera MAX_BYTES_PARTICIONES, los más antiguos.
+# La poda corre al guardar, como mucho una vez cada INTERVALO_PODA segundos.
+MAX_EDAD_PARTICION = 7 * 24 * 60 * 60
+MAX_BYTES_PARTICIONES = 1024 * 1024 * 1024
+INTERVALO_PODA = 10 * 60
+
+_lock_particiones = threading.Lock()
+_ultima_poda = 0.0
+
+# Tramos devueltos sin guardar, por motivo. Si la API filtra por un campo de fecha
+# distinto de `columnas_fecha`, el almacén nunca guarda nada: este contador y el
+# aviso en el log lo hacen visible.
+tramos_sin_guardar = {}
+_log = logging.getLogger(__name__)
+
+
+def _directorio_privado() -> bool:
+    """
+    Crea DIRECTORIO_PARTICIONES con permisos 0o700 o verifica que el existente
+    sea del usuario del proceso y no lo puedan leer otros. Devuelve False si no
+    se puede usar (en ese caso las consultas se devuelven sin guardar).
+    """
+    try:
+        os.makedirs(DIRECTORIO_PARTICIONES, mode=0o700, exist_ok=True)
+        estado = os.stat(DIRECTORIO_PARTICIONES)
+        if hasattr(os, "getuid") and estado.st_uid != os.getuid():
+            return False
+        if estado.st_mode & 0o077:
+            os.chmod(DIRECTORIO_PARTICIONES, 0o700)
+    except OSError:
+        return False
+    return True
+
+
+def _podar_particiones(ahora: float) -> None:
+    """Borra los días vencidos por edad y luego los más antiguos por tamaño total."""
+    global _ultima_poda
+    if ahora - _ultima_poda < INTERVALO_PODA:
+        return
+    _ultima_poda = ahora
+
+    archivos = []
+    for raiz, _, nombres in os.walk(DIRECTORIO_PARTICIONES):
+        for nombre in nombres:
+            ruta = os.path.join(raiz, nombre)
+            try:
+                estado = os.stat(ruta)
+            except OSError:
+                continue
+            archivos.append((estado.st_mtime, estado.st_size, ruta))
+
+    archivos.sort()
+    total = sum(tamano for _, tamano, _ in archivos)
+    for modificado, tamano, ruta in archivos:
+        if ahora - modificado < MAX_EDAD_PARTICION and total <= MAX_BYTES_PARTICIONES:
+            break
+        try:
+            os.remove(ruta)
+            total -= tamano
+        except OSError:
+            pass
+
+
+def _segmento(texto: str) -> str:
+    # Nombre de carpeta seguro y de longitud fija para usuario y filtros
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:16]
+
+
+def _directorio(usuario: str, recurso: str, filtros: dict) -> str:
+    filtros_normalizados = sorted(
+        (nombre, str(valor).strip()) for nombre, valor in filtros.items()
+        if valor is not None and str(valor).strip()
+    )
+    return os.path.join(
+        DIRECTORIO_PARTICIONES, _segmento(str(usuario)), recurso, _segmento(repr(filtros_normalizados))
+    )
+
+
+def _ruta_dia(directorio: str, dia: date) -> str:
+    return os.path.join(directorio, f"{dia.isoformat()}.parquet")
+
+
+def _dia_vigente(ruta: str, dia: date, hoy: date, ahora: float) -> bool:
+    if dia > hoy - timedelta(days=DIAS_SIEMPRE_FRESCOS):
+        return False
+    try:
+        return ahora - os.path.getmtime(ruta) < VIGENCIA_PARTICION
+    except OSError:
+        return False
+
+
+def _tramos_faltantes(dias: list, vigentes: set) -> list:
+    """Agrupa los días no vigentes en tramos contiguos [(inicio, fin)]."""
+    tramos = []
+    for dia in dias:
+        if dia in vigentes:
+            continue
+        if tramos and tramos[-1][1] == dia - timedelta(days=1):
+            tramos[-1] = (tramos[-1][0], dia)
+        else:
+            tramos.append((dia, dia))
+    return tramos
+
+
+def _guardar_dia(directorio: str, dia: date, df: pd.DataFrame) -> None:
+    # Escritura atómica: otra sesión nunca lee un archivo a medio escribir
+    os.makedirs(directorio, mode=0o700, exist_ok=True)
+    ruta = _ruta_dia(directorio, dia)
+    temporal = f"{ruta}.{threading.get_ident()}.tmp"
+    df.to_parquet(temporal, index=False)
+    os.replace(temporal, ruta)
+
+
+def _partir_por_dia(df: pd.DataFrame, columnas_fecha: Iterable[str], inicio: date, fin: date) -> tuple:
+    """
+    Reparte las filas de un tramo por día usando la primera columna de fecha
+    disponible. Devuelve ({dia: DataFrame}, None) con todos los días del tramo
+    (vacíos incluidos) o (None, motivo) si alguna fila no se puede ubicar en un
+    día del tramo.
+    """
+    dias = [inicio + timedelta(days=i) for i in range((fin - inicio).days + 1)]
+    if df.empty:
+        return {dia: df for dia in dias}, None
+
+    columnas_fecha = list(columnas_fecha)
+    columna = next((c for c in columnas_fecha if c in df.columns), None)
+    if columna is None:
+        return None, f"sin columna de fecha ({', '.join(columnas_fecha)})"
+    fechas = pd.to_datetime(df[columna], errors="coerce").dt.date
+    if fechas.isna().any():
+        return None, f"fechas vacías o inválidas en '{columna}'"
+    if not fechas.between(inicio, fin).all():
+        return None, f"filas con '{columna}' fuera del rango consultado"
+
+    grupos = {dia: parte for dia, parte in df.groupby(fechas, sort=False)}
+    return {dia: grupos.get(dia, df.iloc[0:0]) for dia in dias}, None
+
+
+def consulta_incremental(usuario: str, recurso: str, fecha_inicio: date, fecha_fin: date,
+                         filtros: dict, obtener_rango: Callable[[date, date], Optional[Union[list, pd.DataFrame]]],
+                         columnas_fecha: Iterable[str]) -> Optional[pd.DataFrame]:
+    """
+    Devuelve los registros de [fecha_inicio, fecha_fin] combinando los días ya
+    guardados con los que se piden a la API mediante `obtener_rango(inicio, fin)`
+    (que devuelve los registros, como lista o DataFrame, o None si hubo un error).
+
+    Los días pedidos se guardan para la próxima consulta solo si todas sus filas
+    se pueden ubicar por `columnas_fecha` y el directorio de particiones es
+    privado; si no, se devuelven sin guardar.
+    """
+    directorio = _directorio(usuario, recurso, filtros)
+    dias = [fecha_inicio + timedelta(days=i) for i in range((fecha_fin - fecha_inicio).days + 1)]
+    hoy, ahora = date.today(), time.time()
+
+    privado = _directorio_privado()
+    vigentes = {dia for dia in dias if privado and _dia_vigente(_ruta_dia(directorio, dia), dia, hoy, ahora)}
+    partes = {}
+
+    for inicio, fin in _tramos_faltantes(dias, vigentes):
+        registros = obtener_rango(inicio, fin)
+        if registros is None:
+            return None
+        df_tramo = pd.DataFrame(registros)
+        por_dia, motivo = _partir_por_dia(df_tramo, columnas_fecha, inicio, fin)
+        if por_dia is None:
+            with _lock_particiones:
+                tramos_sin_guardar[(recurso, motivo)] = tramos_sin_guardar.get((recurso, motivo), 0) + 1
+            _log.warning("Particiones de '%s' %s a %s sin guardar: %s", recurso, inicio, fin, motivo)
+            partes[inicio] = df_tramo
+            continue
+        partes.update(por_dia)
+        if not privado:
+            continue
+        with _lock_particiones:
+            try:
+                for dia, df_dia in por_dia.items():
+                    _guardar_dia(directorio, dia, df_dia)
+            except (OSError, ValueError, TypeError):
+                # Columnas con tipos mezclados no se pueden guardar en Parquet;
+                # el resultado se devuelve igual, solo que sin guardar
+                pass
+            _podar_particiones(ahora)
+
+    for dia in vigentes:
+        try:
+            partes[dia] = pd.read_parquet(_ruta_dia(directorio, dia))
+        except (OSError, ValueError):
+            # Archivo borrado o dañado entre la revisión y la lectura
+            registros = obtener_rango(dia, dia)
+            if registros is None:
+                return None
+            partes[dia] = pd.DataFrame(registros)
+
+    no_vacias = [partes[dia] for dia in sorted(partes) if not partes[dia].empty]
+    if not no_vacias:
+        return pd.DataFrame()
+    return pd.concat(no_vacias, ignore_index=True)
+
+
+def invalidar_particiones(recurso: str, fecha_inicio: date, fecha_fin: date) -> int:
+    """
+    Borra los días guardados de `recurso` entre fecha_inicio y fecha_fin, para
+    todos los usuarios y filtros. Devuelve cuántos archivos se borraron.
+    """
+    nombres = {
+        f"{(fecha_inicio + timedelta(days=i)).isoformat()}.parquet"
+        for i in range((fecha_fin - fecha_inicio).days + 1)
+    }
+    borrados = 0
+    with _lock_particiones:
+        for raiz, _, archivos in os.walk(DIRECTORIO_PARTICIONES):
+            if os.path.basename(os.path.dirname(raiz)) != recurso:
+                continue
+            for archivo in archivos:
+                if archivo in nombres:
+                    try:
+                        os.remove(os.path.join(raiz, archivo))
+                        borrados += 1
+                    except OSError:
+                        pass
+    return borrados
+
+
+def invalidar_registros_cargados(registros: pd.DataFrame, recurso: str = RECURSO_REPORTE,
+                                 columnas_fecha: Iterable[str] = COLUMNAS_FECHA_REPORTE) -> Optional[tuple]:
+    """
+    Tras cargar `registros` en el backend, descarta las consultas en caché y los
+    días guardados de `recurso` en el rango de fechas de esos registros (todas
+    las columnas de `columnas_fecha` presentes). Devuelve el rango (min, max) o
+    None si los registros no tienen fechas.
+    """
+    dias = []
+    for columna in columnas_fecha:
+        if columna in registros.columns:
+            dias.extend(pd.to_datetime(registros[columna], errors="coerce", format="mixed").dropna().dt.date.unique())
+    if not dias:
+        return None
+    fecha_inicio, fecha_fin = min(dias), max(dias)
+    invalidar_consultas(recurso, fecha_inicio, fecha_fin)
+    invalidar_particiones(recurso, fecha_inicio, fecha_fin)
+    return fecha_inicio, fecha_fin
@@ -1,13 +1,49 @@
+import hashlib
 import pandas as pd
 import re
 import numpy as np
 from typing import Dict, Any
 
+from procesamiento.utils import a_categoricas, sin_categoricas
+
 
 '''
 esto debe ser un EXCEL
 '''
 
+# Unidades por paca en la descripción del producto, p. ej. "PRODUCTO X (12)"
+PATRON_UNIDADES_PACA = re.compile(r"\((\d+)\)")
+# Memo producto -> unidades por paca (los productos se repiten en muchas líneas)
+MAX_MEMO_UNIDADES_PACA = 50_000
+_memo_unidades_paca: Dict[str, int] = {}
+
+
+def unidades_por_paca(productos: pd.Series) -> pd.Series:
+    """
+    Devuelve las unidades por paca de cada producto (el primer número entre
+    paréntesis de la descripción, o 1 si no tiene). La expresión regular se
+    aplica una sola vez por producto distinto y el resultado queda en memoria.
+    """
+    codigos, unicos = pd.factorize(productos, use_na_sentinel=False)
+    textos = [str(producto) for producto in unicos]
+
+    conocidos = {texto: _memo_unidades_paca.get(texto) for texto in textos}
+    faltantes = [texto for texto, valor in conocidos.items() if valor is None]
+    if faltantes:
+        extraidos = pd.Series(faltantes, dtype=object).str.extract(PATRON_UNIDADES_PACA, expand=False)
+        nuevos = dict(zip(faltantes, extraidos.fillna("1").astype("int64").tolist()))
+        conocidos.update(nuevos)
+        if len(_memo_unidades_paca) + len(nuevos) > MAX_MEMO_UNIDADES_PACA:
+            _memo_unidades_paca.clear()
+        _memo_unidades_paca.update(nuevos)
+
+    valores = np.array([conocidos[texto] for texto in textos], dtype="int64")
+    return pd.Series(valores[codigos], index=productos.index, name=productos.name)
+
+# Versión de rutaPesodf en la caché de archivos cargados (subir si cambia);
+# la usan Ruta y Peso y Conductores, que comparten el resumen
+VERSION_RUTA_PESO = 1
+
 def rutaPesodf (df_crudo: pd.DataFrame) -> pd.DataFrame:
     if not isinstance(df_crudo, pd.DataFrame):
         raise TypeError("La función espera un objeto pd.DataFrame como entrada.")
@@ -30,15 +66,8 @@ def transformacionPicking (df_crudo: pd.DataFrame) -> pd.DataFrame:
     # Copia de seguridad para no modificar el DataFrame original (si aplica)
     pickzona = df_crudo.copy()
     
-    def extract_number(text):
-        match = re.search(r"\((\d+)\)", str(text))
-        if match:
-          return int(match.group(1))
-        else:
-          return 1
-      
-    # Aplicar la función
-    pickzona["Unidadesxpaca"] = pickzona["producto"].apply(extract_number)
+    # Unidades por paca, calculadas una vez por producto distinto
+    pickzona["Unidadesxpaca"] = unidades_por_paca(pickzona["producto"])
     
     # Create columna de pacas
     pickzona["paca"] = np.where(
@@ -55,108 +84,94 @@ def transformacionPicking (df_crudo: pd.DataFrame) -> pd.DataFrame:
     
     return pickzona
 
-#Es una función que agrupa todo lo que se esta pidiendo
-def listadoTotal (df_crudo: pd.DataFrame) -> pd.DataFrame:
-     
+def unir_distintos(df: pd.DataFrame, claves, columnas: Dict[str, str], separador: str = ", ") -> pd.DataFrame:
+    """
+    Equivalente vectorizado de groupby(claves).agg(salida=(columna, lambda x: ", ".join(x.unique())))
+    para varias columnas a la vez: {nombre_salida: columna}. Conserva el orden de
+    aparición de los valores dentro de cada grupo y el índice/orden de groupby.
+    Los valores nulos se omiten (un grupo sin valores queda como "").
+    """
+    agrupado = df.groupby(claves, sort=True, observed=True)
+    codigos = agrupado.ngroup().to_numpy()
+    indice = agrupado.size().index
+
+    resultado = {}
+    for salida, columna in columnas.items():
+        codigos_valor, valores = pd.factorize(df[columna])
+        validos = (codigos >= 0) & (codigos_valor >= 0)
+        n_valores = max(len(valores), 1)
+
+        # Pares (grupo, valor) distintos como un solo entero, en orden de aparición
+        pares = pd.unique(codigos[validos].astype("int64") * n_valores + codigos_valor[validos])
+        grupos = pares // n_valores
+        orden = np.argsort(grupos, kind="stable")
+        grupos = grupos[orden]
+        textos = np.asarray(valores, dtype=object)[(pares % n_valores)[orden]]
+
+        unidos = np.full(len(indice), "", dtype=object)
+        if len(grupos):
+            cortes = np.flatnonzero(grupos[1:] != grupos[:-1]) + 1
+            unidos[grupos[np.r_[0, cortes]]] = [separador.join(parte) for parte in np.split(textos, cortes)]
+        resultado[salida] = unidos
+
+    return pd.DataFrame(resultado, index=indice)
+
+
+def _validar_entrada(df_crudo) -> None:
     if not isinstance(df_crudo, pd.DataFrame):
         raise TypeError("La función espera un objeto pd.DataFrame como entrada.")
 
-    # Copia de seguridad para no modificar el DataFrame original (si aplica)
-    #A todos se les aplica la función de transformación
-    pickzona = df_crudo.copy()
-    pickzona = transformacionPicking(pickzona)
-    
-    pickzona["codigoZona"] = pickzona["codigoZona"].fillna("Otras Zonas")  # Fill None values with empty string
-    listadototal = pickzona.groupby(["marca", "producto"])[
-         ["cantidad", "paca", "unidades", "origen", "codigoZona"]
-    ].agg(
+
+############ Reportes sobre el DataFrame ya transformado (transformacionPicking) ########
+# No modifican `pickzona`: el mismo DataFrame transformado se comparte entre reportes.
+
+def _rellenar_nulos(serie: pd.Series, valor: str) -> pd.Series:
+    # En columnas 'category' el valor de relleno debe existir como categoría
+    if isinstance(serie.dtype, pd.CategoricalDtype) and valor not in serie.cat.categories:
+        serie = serie.cat.add_categories([valor])
+    return serie.fillna(valor)
+
+
+def _listado_total(pickzona: pd.DataFrame) -> pd.DataFrame:
+    pickzona = pickzona.assign(codigoZona=_rellenar_nulos(pickzona["codigoZona"], "Otras Zonas"))
+    claves = ["marca", "producto"]
+    listadototal = pickzona.groupby(claves, observed=True)[["cantidad", "paca", "unidades"]].agg(
        Unidades_pedidas=("cantidad", "sum"),
        Pacas=("paca", "sum"),
        Unidades_faltantes=("unidades", "sum"),
-       Origen=("origen", lambda x: ", ".join(x.unique())),
-       Zona=("codigoZona", lambda x: ", ".join(x.unique())),
+    ).join(
+       unir_distintos(pickzona, claves, {"Origen": "origen", "Zona": "codigoZona"})
     ).reset_index()
     
-    return listadototal
+    return sin_categoricas(listadototal)
 
 
-def BultosMasivo (df_crudo: pd.DataFrame) -> pd.DataFrame:
-     
-    if not isinstance(df_crudo, pd.DataFrame):
-        raise TypeError("La función espera un objeto pd.DataFrame como entrada.")
-    #A todos se les aplica la función de transformación
-    pickzona = df_crudo.copy()
-    pickbultos = transformacionPicking(pickzona)
-
-    filtro_bultos = pickbultos["paca"] > 0
-    pickbultos = pickbultos[filtro_bultos]
-    Bultos_pickingmasivo = pickbultos.groupby(
-        ["marca", "producto"]
-    )[["paca", "codigoZona","origen"]].agg(
-        Pacas=("paca", "sum"),
-        codigoZona= ("codigoZona", lambda x: ", ".join(x.unique())),
-        Origen=("origen", lambda x: ", ".join(x.unique()))).reset_index()
+def _bultos_masivo(pickbultos: pd.DataFrame) -> pd.DataFrame:
+    pickbultos = pickbultos[pickbultos["paca"] > 0]
+    claves = ["marca", "producto"]
+    Bultos_pickingmasivo = pickbultos.groupby(claves, observed=True)[["paca"]].agg(
+        Pacas=("paca", "sum")
+    ).join(
+        unir_distintos(pickbultos, claves, {"codigoZona": "codigoZona", "Origen": "origen"})
+    ).reset_index()
     
-    return Bultos_pickingmasivo
+    return sin_categoricas(Bultos_pickingmasivo)
 
-def BultosMasivo2 (df_crudo: pd.DataFrame) -> pd.DataFrame:
-     
-    if not isinstance(df_crudo, pd.DataFrame):
-        raise TypeError("La función espera un objeto pd.DataFrame como entrada.")
-    #A todos se les aplica la función de transformación
-    pickzona = df_crudo.copy()
-    pickbultos = transformacionPicking(pickzona)
-
-    filtro_bultos = pickbultos["paca"] > 0
-    pickbultos = pickbultos[filtro_bultos]
-    Bultos_pickingmasivo = pickbultos.groupby(
-        ["codigoZona","marca", "producto"]
-    )[["paca","origen"]].agg(
-        Pacas=("paca", "sum"),
-        Origen=("origen", lambda x: ", ".join(x.unique()))).reset_index()
+
+def _bultos_masivo2(pickbultos: pd.DataFrame) -> pd.DataFrame:
+    pickbultos = pickbultos[pickbultos["paca"] > 0]
+    claves = ["codigoZona","marca", "producto"]
+    Bultos_pickingmasivo = pickbultos.groupby(claves, observed=True)[["paca"]].agg(
+        Pacas=("paca", "sum")
+    ).join(
+        unir_distintos(pickbultos, claves, {"Origen": "origen"})
+    ).reset_index()
     
-    return Bultos_pickingmasivo
+    return sin_categoricas(Bultos_pickingmasivo)
 
-def categorize_conductor(conductor):
-    conductor = str(conductor).lower()
-    if 'transportadora' in conductor:
-        return 'TRANSPORTADORA'
-    elif 'santiago' in conductor:
-        return 'SANTIAGO'
-    elif 'edgar' in conductor:
-        return 'EDGAR'
-    elif 'juan david' in conductor:
-        return 'JUAN DAVID'
-    elif 'jesus' in conductor:
-        return 'DARIO'
-    elif 'dario' in conductor:
-        return 'DARIO'
-    elif 'peligro' in conductor:
-        return 'PELIGRO'
-    elif 'fabio' in conductor:
-        return 'FABIO'
-    elif 'samuel' in conductor:
-        return 'SAMUEL'
-    elif 'transportadora' in conductor:
-        return 'TRANSPORTADORA'
-    elif 'agencia' in conductor:
-        return 'AGENCIAS'
-    elif 'juan bernal' in conductor:
-        return 'JUAN BERNAL'
-    else:
-        return ''
 
-def BultosMasivoConductores (df_crudo: pd.DataFrame) -> pd.DataFrame:
-    
-    if not isinstance(df_crudo, pd.DataFrame):
-        raise TypeError("La función espera un objeto pd.DataFrame como entrada.")
-        
-    pickzona = df_crudo.copy()
-    # pickbultos debe ser el resultado de la función de transformación
-    # asumiendo que ya tiene las columnas 'paca', 'codigoZona', 'zona', 'origen', 'producto', y 'conductor'.
-    pickbultos = transformacionPicking(pickzona)
-    
-    pickbultos['conductor'] = pickbultos['conductor'].apply(categorize_conductor)
+def _bultos_masivo_conductores(pickbultos: pd.DataFrame) -> pd.DataFrame:
+    pickbultos = pickbultos.assign(conductor=categorizar_conductores(pickbultos['conductor']))
     
 
     # --- CLAVES DE AGRUPACIÓN ACTUALIZADAS ---
@@ -166,7 +181,8 @@ def BultosMasivoConductores (df_crudo: pd.DataFrame) -> pd.DataFrame:
 
     # 1. Agrupar TODAS las combinaciones de producto/origen.
     df_agrupado_productos = pickbultos.groupby(
-        CLAVES_AGRUPACION # <-- Usando las nuevas claves
+        CLAVES_AGRUPACION, # <-- Usando las nuevas claves
+        observed=True,
     )[["paca"]].agg(
         Pacas=("paca", "sum")
     ).reset_index() 
@@ -174,7 +190,7 @@ def BultosMasivoConductores (df_crudo: pd.DataFrame) -> pd.DataFrame:
     
     # 2. Identificar qué orígenes tienen CERO pacas en total (por origen, NO por conductor)
     #    Mantenemos la lógica de origen para saber qué origen poner "No lleva bultos"
-    total_pacas_por_origen = df_agrupado_productos.groupby('origen')['Pacas'].sum()
+    total_pacas_por_origen = df_agrupado_productos.groupby('origen', observed=True)['Pacas'].sum()
     origenes_sin_bultos = total_pacas_por_origen[total_pacas_por_origen == 0].index.tolist()
     origenes_con_bultos = total_pacas_por_origen[total_pacas_por_origen > 0].index.tolist()
 
@@ -202,8 +218,8 @@ def BultosMasivoConductores (df_crudo: pd.DataFrame) -> pd.DataFrame:
     else:
         df_final = reporte_principal
         
-    # 6. Ordenar el resultado para la agrupación visual en Excel
-    df_final = df_final.sort_values(by=CLAVES_AGRUPACION)
+    # 6. Ordenar el resultado para la agrupación visual en Excel (como texto, igual que el exportador)
+    df_final = sin_categoricas(df_final).sort_values(by=CLAVES_AGRUPACION)
     
     # 7. Convertir de nuevo a MultiIndex (REQUERIDO por to_excel_con_fusion para la fusión)
     # El orden aquí dicta el orden de la fusión en Excel (primero conductor, luego zona, etc.)
@@ -211,48 +227,180 @@ def BultosMasivoConductores (df_crudo: pd.DataFrame) -> pd.DataFrame:
     
     return df_final
 
-def Regerospickingmasivo (df_crudo: pd.DataFrame) -> pd.DataFrame:
-     
-    if not isinstance(df_crudo, pd.DataFrame):
-        raise TypeError("La función espera un objeto pd.DataFrame como entrada.")
-    # Copia de seguridad para no modificar el DataFrame original (si aplica)
-    #A todos se les aplica la función de transformación
-    pickzona = df_crudo.copy()
-    pickregerosm = transformacionPicking(pickzona)
-    filtro_pickregerosm = pickregerosm["unidades"] > 0
-    pickregerosm = pickregerosm[filtro_pickregerosm]
-    Regeros_pickingmasivo = pickregerosm.groupby(["marca", "producto"])[
-          ["unidades","codigoZona", "origen"]
-    ].agg(
-          unidades=("unidades", "sum"),
-          codigoZona= ("codigoZona", lambda x: ", ".join(x.unique())),
-          Origen=("origen", lambda x: ", ".join(x.unique()))).reset_index()
-    
-    return Regeros_pickingmasivo
 
+def _regueros_picking_masivo(pickregerosm: pd.DataFrame) -> pd.DataFrame:
+    pickregerosm = pickregerosm[pickregerosm["unidades"] > 0]
+    claves = ["marca", "producto"]
+    Regeros_pickingmasivo = pickregerosm.groupby(claves, observed=True)[["unidades"]].agg(
+          unidades=("unidades", "sum")
+    ).join(
+          unir_distintos(pickregerosm, claves, {"codigoZona": "codigoZona", "Origen": "origen"})
+    ).reset_index()
+    
+    return sin_categoricas(Regeros_pickingmasivo)
 
-#La respuesta de este es un diccionario con datos(Se divide por zona)
-def RegerosSeleccion(df_crudo: pd.DataFrame) -> pd.DataFrame:
-    if not isinstance(df_crudo, pd.DataFrame):
-        raise TypeError("La función espera un objeto pd.DataFrame como entrada.")
 
-    pickzona = df_crudo.copy()
-    
-    # 1. APLICAR TRANSFORMACIÓN Y FILTRADO
-    pickregeros = transformacionPicking(pickzona)
-    
+def _regueros_seleccion(pickregeros: pd.DataFrame) -> pd.DataFrame:
     # Aplicar el filtro después de la transformación
-    filtro_r = pickregeros["unidades"] > 0
-    df_filtrado = pickregeros[filtro_r]
+    df_filtrado = pickregeros[pickregeros["unidades"] > 0]
     
-    # 2. AGRUPACIÓN Y AGREGACIÓN
+    # Agrupación y agregación
     df_regueros = df_filtrado.groupby(
-        by=["codigoZona", "zona", "origen", "marca","producto"]
+        by=["codigoZona", "zona", "origen", "marca","producto"],
+        observed=True,
     ).agg(
         Unidades=("unidades", "sum")
     ).reset_index() 
         
-    return df_regueros
+    return sin_categoricas(df_regueros)
+
+
+############ Reportes a partir del DataFrame de pickingPacking #########################
+# Cada función transforma el DataFrame por su cuenta; para generar varios reportes
+# del mismo corte conviene usar CortePreparado.
+
+#Es una función que agrupa todo lo que se esta pidiendo
+def listadoTotal (df_crudo: pd.DataFrame) -> pd.DataFrame:
+    _validar_entrada(df_crudo)
+    #A todos se les aplica la función de transformación
+    return _listado_total(transformacionPicking(df_crudo))
+
+
+def BultosMasivo (df_crudo: pd.DataFrame) -> pd.DataFrame:
+    _validar_entrada(df_crudo)
+    return _bultos_masivo(transformacionPicking(df_crudo))
+
+
+def BultosMasivo2 (df_crudo: pd.DataFrame) -> pd.DataFrame:
+    _validar_entrada(df_crudo)
+    return _bultos_masivo2(transformacionPicking(df_crudo))
+
+
+# Reglas de conductor (patrón -> conductor), en orden de prioridad: se evalúan
+# sobre el texto en minúsculas y gana la primera regla que aparece. Sin
+# coincidencia el conductor queda ''. Para agregar un conductor basta una fila.
+REGLAS_CONDUCTOR = [
+    ("transportadora", "TRANSPORTADORA"),
+    ("santiago", "SANTIAGO"),
+    ("edgar", "EDGAR"),
+    ("juan david", "JUAN DAVID"),
+    ("jesus", "DARIO"),
+    ("dario", "DARIO"),
+    ("peligro", "PELIGRO"),
+    ("fabio", "FABIO"),
+    ("samuel", "SAMUEL"),
+    ("agencia", "AGENCIAS"),
+    ("juan bernal", "JUAN BERNAL"),
+]
+
+
+def compilar_reglas_conductor(reglas) -> re.Pattern:
+    """
+    Une las reglas en una sola expresión regular. Cada regla es una alternativa
+    anclada al inicio con su propio grupo (r0, r1, ...); el motor de regex prueba
+    las alternativas en orden, así gana la primera regla que coincide y no la
+    coincidencia más a la izquierda del texto.
+    """
+    alternativas = [f"(?=.*?(?P<r{i}>{patron}))" for i, (patron, _) in enumerate(reglas)]
+    return re.compile("^(?:" + "|".join(alternativas) + ")", re.DOTALL)
+
+
+_PATRON_CONDUCTOR = compilar_reglas_conductor(REGLAS_CONDUCTOR)
+
+# Versión de los datos de Conductores en la caché de archivos cargados: se
+# deriva de REGLAS_CONDUCTOR, así que cambia sola al editar las reglas
+VERSION_CONDUCTORES = hashlib.sha256(repr(REGLAS_CONDUCTOR).encode("utf-8")).hexdigest()[:12]
+
+
+def categorizar_conductores(conductores: pd.Series, reglas=None) -> pd.Series:
+    """
+    Conductor canónico de cada fila según `reglas` (por defecto REGLAS_CONDUCTOR).
+    La expresión se aplica una sola vez por valor distinto (categorías si la
+    columna ya es categórica) y el resultado se reparte a las filas.
+    """
+    if reglas is None:
+        reglas, patron = REGLAS_CONDUCTOR, _PATRON_CONDUCTOR
+    else:
+        patron = compilar_reglas_conductor(reglas)
+
+    if isinstance(conductores.dtype, pd.CategoricalDtype):
+        posiciones = conductores.cat.codes.to_numpy()
+        distintos = list(conductores.cat.categories)
+        # Los nulos (código -1) se evalúan como el texto 'nan', igual que str(nan)
+        posiciones = np.where(posiciones < 0, len(distintos), posiciones)
+        distintos.append(np.nan)
+    else:
+        posiciones, distintos = pd.factorize(conductores, use_na_sentinel=False)
+
+    valores = np.full(len(distintos), "", dtype=object)
+    if reglas:
+        textos = pd.Series([str(valor).lower() for valor in distintos], dtype=object)
+        grupos = textos.str.extract(patron)[[f"r{i}" for i in range(len(reglas))]]
+        coincide = grupos.notna().to_numpy()
+        alguna = coincide.any(axis=1)
+        nombres = np.array([conductor for _, conductor in reglas], dtype=object)
+        valores[alguna] = nombres[coincide.argmax(axis=1)[alguna]]
+
+    return pd.Series(valores[posiciones], index=conductores.index, name=conductores.name)
+
+
+def categorize_conductor(conductor):
+    return categorizar_conductores(pd.Series([conductor], dtype=object)).iloc[0]
+
+def BultosMasivoConductores (df_crudo: pd.DataFrame) -> pd.DataFrame:
+    _validar_entrada(df_crudo)
+    # Requiere las columnas 'paca', 'codigoZona', 'zona', 'origen', 'producto' y 'conductor'
+    return _bultos_masivo_conductores(transformacionPicking(df_crudo))
+
+
+def Regerospickingmasivo (df_crudo: pd.DataFrame) -> pd.DataFrame:
+    _validar_entrada(df_crudo)
+    return _regueros_picking_masivo(transformacionPicking(df_crudo))
+
+
+#La respuesta de este es un diccionario con datos(Se divide por zona)
+def RegerosSeleccion(df_crudo: pd.DataFrame) -> pd.DataFrame:
+    _validar_entrada(df_crudo)
+    return _regueros_seleccion(transformacionPicking(df_crudo))
+
+
+class CortePreparado:
+    """
+    Corte de picking con transformacionPicking calculado una sola vez
+    (columnas Unidadesxpaca, paca y unidades) y las columnas clave como
+    'category' (a_categoricas). Cada reporte se calcula sobre
+    ese DataFrame la primera vez que se pide y luego se reutiliza.
+    Los reportes devueltos se comparten: los exportadores trabajan sobre copias.
+    """
+
+    def __init__(self, df_crudo: pd.DataFrame):
+        _validar_entrada(df_crudo)
+        self.origen = df_crudo
+        self.datos = a_categoricas(transformacionPicking(df_crudo))
+        self._reportes: Dict[str, pd.DataFrame] = {}
+
+    def _reporte(self, nombre: str, construir) -> pd.DataFrame:
+        if nombre not in self._reportes:
+            self._reportes[nombre] = construir(self.datos)
+        return self._reportes[nombre]
+
+    def listadoTotal(self) -> pd.DataFrame:
+        return self._reporte("listadoTotal", _listado_total)
+
+    def BultosMasivo(self) -> pd.DataFrame:
+        return self._reporte("BultosMasivo", _bultos_masivo)
+
+    def BultosMasivo2(self) -> pd.DataFrame:
+        return self._reporte("BultosMasivo2", _bultos_masivo2)
+
+    def BultosMasivoConductores(self) -> pd.DataFrame:
+        return self._reporte("BultosMasivoConductores", _bultos_masivo_conductores)
+
+    def Regerospickingmasivo(self) -> pd.DataFrame:
+        return self._reporte("Regerospickingmasivo", _regueros_picking_masivo)
+
+    def RegerosSeleccion(self) -> pd.DataFrame:
+        return self._reporte("RegerosSeleccion", _regueros_seleccion)
    
     
 
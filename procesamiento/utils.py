@@ -5,45 +5,6 @@ import re
 from typing import Optional 
 import numpy as np 
 
-MARCA_MAP = {
-    "32": "ADORE",
-    "25": "AGRALBA-IVANAGRO",
-    "46": "AMALIAS",
-    "20": "BIOS",
-    "14": "CANAMOR",
-    "44": "CIPA",
-    "18": "CONTEGRAL GRANDES ESPECIES",
-    "19": "FINCA GRANDES ESPECIES",
-    "21": "GABRICA",
-    "24": "ITALCOL",
-    "23": "ITALCOL GRANDES ESPECIES",
-    "27": "JAULAS",
-    "29": "KITTY PAW",
-    "30": "LABORATORIOS ZOO",
-    "36": "MAXIPETS",
-    "45": "MONAMI",
-    "47": "FINOTRATO",
-    "26": "NUTRA NUGGETS",
-    "38": "PINOMININO",
-    "12": "POLAR",
-    "00": "PUNTO DE VENTA-OTROS",
-    "02": "PUNTO DE VENTA-OTROS",
-    "1": "PUNTO DE VENTA-OTROS",
-    "15": "PUNTO DE VENTA-OTROS",
-    "17": "PUNTO DE VENTA-OTROS",
-    "28": "PUNTO DE VENTA-OTROS",
-    "35": "PUNTO DE VENTA-OTROS",
-    "39": "PUNTO DE VENTA-OTROS",
-    "CR": "PUNTO DE VENTA-OTROS",
-    "10": "PUNTOMERCA",
-    "37": "PANDAPAN",
-    "40": "PURINA",
-    "41": "SEMILLAS",
-    "42": "SOLLA",
-    "43": "SOLLA MASCOTAS",
-    "34": "TETRACOLOR",
-}
-
 
 def json_serial_default(obj):
     """
@@ -96,8 +57,7 @@ def limpiar_y_preparar_detalle(data_or_path) -> pd.DataFrame:
 
     # Extraer marca
     if "Movimientos de Existencias/Descripción" in data.columns:
-        data["marca"] = data["Movimientos de Existencias/Descripción"].str.slice(1, 3)
-        data["marca"] = data["marca"].replace(MARCA_MAP)
+        data["marca"], _ = resolver_marca(data["Movimientos de Existencias/Descripción"])
     else:
         data["marca"] = "OTROS"
 
@@ -152,6 +112,90 @@ def validation_data(df) -> str | None:
     
 
 
+def _escribir_columna(worksheet, fila_inicio, col_num, valores, cell_format, filas=None):
+    """
+    Escribe una columna completa a partir de `fila_inicio` (o en las `filas`
+    indicadas, una por valor, cuando los datos no son contiguos en la hoja).
+    Los nulos se detectan una sola vez con una máscara y se escriben como
+    cadena vacía (igual que la escritura celda a celda con write_string).
+    """
+    nulos = pd.isna(valores).to_numpy()
+    datos = valores.tolist()
+
+    if filas is None:
+        if not nulos.any():
+            worksheet.write_column(fila_inicio, col_num, datos, cell_format)
+            return
+        filas = range(fila_inicio, fila_inicio + len(datos))
+
+    for fila, valor, es_nulo in zip(filas, datos, nulos):
+        if es_nulo:
+            worksheet.write_string(fila, col_num, '', cell_format)
+        else:
+            worksheet.write(fila, col_num, valor, cell_format)
+
+
+# --- Planificador de fusiones (run-length) ---
+# Cada exportador decide cuándo un valor inicia un nuevo grupo:
+#   "estricta":      nuevo grupo si valor != anterior (cada NaN es su propio grupo)
+#   "nulo_continua": un NaN nunca inicia grupo, se une al grupo anterior
+#   "nulos_iguales": NaN se considera igual a NaN y distinto de cualquier valor
+FUSION_ESTRICTA = "estricta"
+FUSION_NULO_CONTINUA = "nulo_continua"
+FUSION_NULOS_IGUALES = "nulos_iguales"
+
+
+def planificar_fusiones(df_sheet: pd.DataFrame, columnas, modo: str = FUSION_ESTRICTA, cortes=None) -> dict:
+    """
+    Calcula los grupos consecutivos (inicio, fin, valor) de cada columna a fusionar.
+    Las posiciones son relativas a la primera fila de datos de `df_sheet`.
+    `cortes` es una máscara booleana opcional que obliga a iniciar grupo en esas filas.
+    """
+    num_rows = len(df_sheet)
+    plan = {}
+
+    for col_name in columnas:
+        if num_rows == 0:
+            plan[col_name] = []
+            continue
+
+        serie = df_sheet[col_name]
+        valores = serie.to_numpy(dtype=object)
+        actual, anterior = valores[1:], valores[:-1]
+        distinto = actual != anterior
+
+        if modo == FUSION_ESTRICTA:
+            cambio = distinto
+        elif modo == FUSION_NULO_CONTINUA:
+            cambio = ~pd.isna(actual) & distinto
+        elif modo == FUSION_NULOS_IGUALES:
+            nulo_actual, nulo_anterior = pd.isna(actual), pd.isna(anterior)
+            cambio = (nulo_actual ^ nulo_anterior) | (~nulo_actual & ~nulo_anterior & distinto)
+        else:
+            raise ValueError(f"Modo de fusión desconocido: {modo}")
+
+        if cortes is not None:
+            cambio = cambio | cortes[1:]
+
+        inicios = np.concatenate(([0], np.flatnonzero(cambio) + 1))
+        fines = np.concatenate((inicios[1:] - 1, [num_rows - 1]))
+        datos = serie.tolist()
+        plan[col_name] = [(int(i), int(f), datos[i]) for i, f in zip(inicios, fines)]
+
+    return plan
+
+
+def _escribir_fusiones(worksheet, fila_inicio, col_index, grupos, cell_format):
+    """Escribe los grupos planificados: fusiona si abarcan varias filas, si no escribe la celda."""
+    for inicio, fin, valor in grupos:
+        excel_start = fila_inicio + inicio
+        excel_end = fila_inicio + fin
+        if excel_start < excel_end:
+            worksheet.merge_range(excel_start, col_index, excel_end, col_index, valor, cell_format)
+        else:
+            worksheet.write(excel_start, col_index, valor, cell_format)
+
+
 def to_excel(df, base_titulo=str): # Nota: base_titulo=str es un patrón inusual para un valor por defecto.
     """
     Convierte el DataFrame a un archivo Excel binario, ajustando el ancho,
@@ -170,13 +214,12 @@ def to_excel(df, base_titulo=str): # Nota: base_titulo=str es un patrón inusual
     startrow_data = 1 
     
     with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        
-        # Escribir el DF. startrow=1 para dejar la Fila 0 libre para el título
-        df.to_excel(writer, index=False, sheet_name=sheet_name, startrow=startrow_data)
-        
+
+        # La hoja se escribe directamente con xlsxwriter (título en Fila 0,
+        # encabezados en Fila 1 y datos desde la Fila 2)
         workbook = writer.book
-        worksheet = writer.sheets[sheet_name]
-        num_rows, num_cols = df.shape
+        worksheet = workbook.add_worksheet(sheet_name)
+        num_cols = df.shape[1]
         
         # --- DEFINICIÓN DE FORMATOS ---
         
@@ -209,21 +252,11 @@ def to_excel(df, base_titulo=str): # Nota: base_titulo=str es un patrón inusual
         worksheet.merge_range(0, 0, 0, num_cols - 1, titulo_completo, title_format)
 
         # 2. Aplicar el formato a los ENCABEZADOS DE COLUMNA (Fila 1)
-        for col_num, value in enumerate(df.columns.values):
-            worksheet.write(startrow_data, col_num, value, header_format)
-
-        # 3. Aplicar el formato de borde a las celdas de DATOS
-        for row_num in range(startrow_data + 1, num_rows + startrow_data + 1):
-            for col_num in range(num_cols):
-                cell_value = df.iloc[row_num - startrow_data - 1, col_num] 
-                
-                # VERIFICACIÓN Y MANEJO DE NaN (SOLUCIÓN AL TypeError)
-                if pd.isna(cell_value):
-                    # Si es NaN o None, escribimos una cadena vacía con write_string
-                    worksheet.write_string(row_num, col_num, '', data_format)
-                else:
-                    # Si contiene datos, usamos la función write() general
-                    worksheet.write(row_num, col_num, cell_value, data_format)
+        worksheet.write_row(startrow_data, 0, list(df.columns.values), header_format)
+
+        # 3. Escribir las celdas de DATOS con borde, columna por columna
+        for col_num in range(num_cols):
+            _escribir_columna(worksheet, startrow_data + 1, col_num, df.iloc[:, col_num], data_format)
         
         # 4. Ajustar el ancho de las columnas
         for i, col in enumerate(df.columns):
@@ -241,31 +274,40 @@ def to_excel(df, base_titulo=str): # Nota: base_titulo=str es un patrón inusual
 
 ############ Transformaciones ##############
 
-def dividir_zona(zona):
-
-    if pd.isna(zona):  # Maneja valores NaN (Not a Number) o None si los hubiera
-        return [None, None]
-    try:
-        partes = str(zona).split(".", 1)  # Divide solo por el primer punto
-        if len(partes) == 1:
-            return [
-                partes[0],
-                None,
-            ]  # Si no hay punto, 'Cod zona' es la zona, 'zona' es None
-        else:
-            return partes
-    except:
-        return [None, None]  # En caso de cualquier otro error, devuelve [None, None]
+#### División de la zona y relleno de zonas vacías (por columna completa)
+def dividir_zona_serie(zonas: pd.Series) -> pd.DataFrame:
+    """
+    Divide cada zona "CODIGO.NOMBRE" por el primer punto.
+    Devuelve un DataFrame con las columnas 'codigoZona' y 'zona' alineado
+    al índice de entrada. Los nulos quedan como None en ambas columnas y,
+    si no hay punto, 'zona' queda en None.
+    """
+    resultado = pd.DataFrame(
+        {"codigoZona": None, "zona": None}, index=zonas.index, dtype=object
+    )
+
+    con_valor = zonas.notna()
+    if not con_valor.any():
+        return resultado
+
+    # Divide solo por el primer punto
+    partes = zonas[con_valor].astype(str).str.split(".", n=1, expand=True)
+    resultado.loc[con_valor, "codigoZona"] = partes[0]
+    if partes.shape[1] > 1:
+        resultado.loc[con_valor, "zona"] = partes[1].where(partes[1].notna(), None)
+
+    return resultado
 
-#### Esta función me permite completar datos nulos en zona
-def zona_blanco(row):
-    # Verificar si 'codigoZona' es nulo o igual al string 'nan'
-    if pd.isna(row["codigoZona"]) or str(row["codigoZona"]).lower() == "nan":
-        row["codigoZona"] = row["cuidad"]
-    # Verificar si 'zona' es nulo o igual al string 'nan'
-    if pd.isna(row["zona"]) or str(row["zona"]).lower() == "nan":
-        row["zona"] = row["cuidad"]
-    return row
+
+def completar_zona_con_ciudad(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rellena 'codigoZona' y 'zona' con 'cuidad' cuando están vacíos o contienen
+    el texto 'nan'.
+    """
+    for col in ("codigoZona", "zona"):
+        vacio = df[col].isna() | (df[col].astype(str).str.lower() == "nan")
+        df.loc[vacio, col] = df.loc[vacio, "cuidad"]
+    return df
 
 
 # --- Constantes ---
@@ -326,6 +368,40 @@ MARCA_MAP = {
     "34": "TETRACOLOR",
 }
 
+# Marca para los códigos que no están en MARCA_MAP. Con None se conserva el
+# código de dos caracteres, como hacía .replace(MARCA_MAP).
+MARCA_DESCONOCIDA = None
+
+
+def resolver_marca(productos: pd.Series, desconocida: Optional[str] = MARCA_DESCONOCIDA):
+    """
+    Marca de cada producto según los caracteres 1-2 de su nombre ("[32..." -> ADORE).
+    El código se extrae y se busca una sola vez por producto distinto (categorías
+    si la columna ya es categórica) y se reparte a las filas por sus códigos.
+    Devuelve (marcas, códigos_sin_marca); los productos nulos quedan sin marca.
+    """
+    if isinstance(productos.dtype, pd.CategoricalDtype):
+        posiciones, distintos = productos.cat.codes.to_numpy(), productos.cat.categories
+    else:
+        posiciones, distintos = pd.factorize(productos)
+
+    codigos = pd.Series(np.asarray(distintos, dtype=object), dtype=object).str.slice(1, 3)
+    marcas = codigos.map(MARCA_MAP).astype(object)
+    sin_marca = (marcas.isna() & codigos.notna()).to_numpy()
+    validas = posiciones >= 0
+    # Solo se informan los códigos de productos presentes (una categórica puede
+    # tener categorías sin filas)
+    usados = np.bincount(posiciones[validas], minlength=len(codigos)) > 0
+    # Un producto corto o mal formado da el código '', que no es una marca por mapear
+    con_codigo = (codigos.str.len() > 0).to_numpy()
+    codigos_sin_marca = sorted(set(codigos[sin_marca & usados & con_codigo]))
+    marcas[sin_marca] = codigos[sin_marca] if desconocida is None else desconocida
+
+    # Los productos nulos conservan su valor (None o NaN), igual que con .str
+    resultado = productos.to_numpy(dtype=object, copy=True)
+    resultado[validas] = marcas.to_numpy(dtype=object)[posiciones[validas]]
+    return pd.Series(resultado, index=productos.index, name="marca"), codigos_sin_marca
+
 
 # --------------------------------------------------------------------------
 # FUNCIÓN PRINCIPAL DE PROCESAMIENTO
@@ -349,30 +425,20 @@ def pickingPacking(df) -> pd.DataFrame:
     
     # Crea las nuevas columnas temporales ('Cod zona' y 'zona')
     # Nota: El nombre 'zonaAsociadoOriginal' es el renombrado final de 'asociado_zona'
-    pickzona[["Cod zona", "zona"]] = (
-        pickzona["zonaAsociadoOriginal"]
-        .apply(dividir_zona)
-        .apply(pd.Series)
-    )
-
-    # Renombra 'Cod zona' a 'codigoZona' (¡Fija el KeyError de 'Cod zona'!)
-    pickzona.rename(columns={"Cod zona": "codigoZona"}, inplace=True)
+    pickzona[["codigoZona", "zona"]] = dividir_zona_serie(pickzona["zonaAsociadoOriginal"])
 
     # El campo 'zonaAsociadoOriginal' ya no es necesario
     del pickzona["zonaAsociadoOriginal"]
 
-    # Aplicar la función de relleno de zona
-    # (Asume que zona_blanco usa los nombres finales 'codigoZona' y 'cuidad')
-    pickzona = pickzona.apply(zona_blanco, axis=1)
+    # Aplicar el relleno de zona con la ciudad
+    pickzona = completar_zona_con_ciudad(pickzona)
 
     # Rellenar valores faltantes (usando el método moderno)
     pickzona = pickzona.ffill()
 
     # Extraer marca
     if "producto" in pickzona.columns:
-        pickzona["marca"] = pickzona["producto"].str.slice(1, 3)
-        pickzona["marca"] = pickzona["marca"].replace(MARCA_MAP)
-        
+        pickzona["marca"], _ = resolver_marca(pickzona["producto"])
     else:
         pickzona["marca"] = "OTROS"
         
@@ -392,12 +458,104 @@ def pickingPacking(df) -> pd.DataFrame:
     return pickzona
 
 
+# --------------------------------------------------------------------------
+# COLUMNAS CATEGÓRICAS (claves de agrupación con muchos valores repetidos)
+# --------------------------------------------------------------------------
+
+COLUMNAS_CATEGORICAS = ("marca", "producto", "codigoZona", "zona", "origen", "conductor")
+
 
-def to_excel_bultos(df, base_titulo: Optional[str] = "REPORTE"):
+def a_categoricas(df: pd.DataFrame, columnas=COLUMNAS_CATEGORICAS) -> pd.DataFrame:
+    """
+    Convierte a 'category' las columnas clave presentes en `df` (texto repetido en
+    muchas filas): menos memoria y groupby/nunique sobre códigos enteros.
+    Las categorías salen del corte completo, así que los subconjuntos que se
+    filtren después comparten las mismas. Los groupby deben usar observed=True.
+    """
+    convertir = [col for col in columnas if col in df.columns and df[col].dtype == object]
+    if not convertir:
+        return df
+    return df.astype({col: "category" for col in convertir})
+
+
+def sin_categoricas(df: pd.DataFrame) -> pd.DataFrame:
+    """Devuelve las columnas 'category' a texto (object) para los exportadores."""
+    categoricas = [col for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)]
+    if not categoricas:
+        return df
+    return df.astype({col: object for col in categoricas})
+
+
+# --------------------------------------------------------------------------
+# MODO STREAMING (constant_memory) PARA LOS EXPORTADORES MULTI-HOJA
+# --------------------------------------------------------------------------
+
+# Con constant_memory xlsxwriter vuelca cada fila a un archivo temporal en cuanto
+# se escribe en la siguiente, así que la memoria del libro no crece con el corte.
+# A partir de este número de filas los exportadores lo usan por defecto.
+FILAS_MEMORIA_CONSTANTE = 100_000
+
+
+def _usar_memoria_constante(df: pd.DataFrame, memoria_constante: Optional[bool]) -> bool:
+    if memoria_constante is None:
+        return len(df) >= FILAS_MEMORIA_CONSTANTE
+    return memoria_constante
+
+
+def _opciones_excel(memoria_constante: bool) -> dict:
+    """Opciones del Workbook de xlsxwriter según el modo de exportación."""
+    return {"options": {"constant_memory": True}} if memoria_constante else {}
+
+
+def _escribir_filas_en_orden(worksheet, df_datos: pd.DataFrame, filas, fusiones: dict,
+                             formato_fusion, formato_normal, antes_de_registro=None):
+    """
+    Escribe los registros de `df_datos` fila por fila, como exige constant_memory
+    (una fila ya volcada no se puede volver a escribir).
+
+    - `filas`: fila de Excel de cada registro, en orden creciente.
+    - `fusiones`: {índice de columna: grupos (inicio, fin, valor)} del planificador,
+      en posiciones de registro. Las demás columnas se escriben sin fusionar.
+    - `antes_de_registro`: {posición: función(worksheet, posición)} para escribir
+      filas intermedias (subtítulos) justo antes de ese registro.
+
+    Cada fusión vertical se registra con merge_range al llegar a su primera fila,
+    sin formato para que no escriba todavía las celdas de abajo; después se da
+    formato a la primera celda y las siguientes se rellenan en blanco, con formato,
+    cuando les toca su fila (las mismas celdas que escribe merge_range).
+    """
+    columnas = range(df_datos.shape[1])
+    nulos = df_datos.isna().to_numpy()
+    # Por columna fusionada: {posición de inicio: (fin, valor)} y fin del grupo en curso
+    inicios = {col: {inicio: (fin, valor) for inicio, fin, valor in grupos} for col, grupos in fusiones.items()}
+    fin_grupo = {col: -1 for col in fusiones}
+
+    for pos, (fila, registro) in enumerate(zip(filas, df_datos.itertuples(index=False, name=None))):
+        if antes_de_registro and pos in antes_de_registro:
+            antes_de_registro[pos](worksheet, pos)
+        for col in columnas:
+            if col not in fusiones:
+                if nulos[pos, col]:
+                    worksheet.write_string(fila, col, '', formato_normal)
+                else:
+                    worksheet.write(fila, col, registro[col], formato_normal)
+            elif pos <= fin_grupo[col]:
+                worksheet.write_blank(fila, col, None, formato_fusion)
+            else:
+                fin, valor = inicios[col][pos]
+                fin_grupo[col] = fin
+                if fin > pos:
+                    worksheet.merge_range(fila, col, filas[fin], col, valor)
+                worksheet.write(fila, col, valor, formato_fusion)
+
+
+def to_excel_bultos(df, base_titulo: Optional[str] = "REPORTE", memoria_constante: Optional[bool] = None):
     """
     Exporta un DataFrame MultiIndex a Excel creando una hoja por cada zona.
     - La columna Pacas NO se fusiona.
     - La columna Origen va al final y TAMPOCO se fusiona.
+    - memoria_constante: escribe en modo streaming (constant_memory); con None,
+      solo a partir de FILAS_MEMORIA_CONSTANTE filas.
     """
 
     df_to_write = df.copy()
@@ -416,8 +574,9 @@ def to_excel_bultos(df, base_titulo: Optional[str] = "REPORTE"):
 
     # --- Salida Excel ---
     output = BytesIO()
+    memoria_constante = _usar_memoria_constante(df_to_write, memoria_constante)
 
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+    with pd.ExcelWriter(output, engine="xlsxwriter", engine_kwargs=_opciones_excel(memoria_constante)) as writer:
         workbook = writer.book
 
         # Format definitions
@@ -471,42 +630,18 @@ def to_excel_bultos(df, base_titulo: Optional[str] = "REPORTE"):
             non_merge_indices = [df_sheet.columns.get_loc(c) for c in df_sheet.columns if c not in MERGE_COLS]
 
             # 3. FUSIÓN DE COLUMNAS PERMITIDAS
-            for col_name, col_index in merge_indices.items():
-                col_vals = df_sheet[col_name]
-                start_idx = 0
-
-                for i in range(1, num_rows + 1):
-                    is_last = (i == num_rows)
-                    curr = col_vals.iloc[i] if not is_last else None
-                    prev = col_vals.iloc[i - 1]
-                    new_group = (not is_last) and (curr != prev)
-
-                    if is_last or new_group:
-                        end_idx = i - 1
-                        excel_start = startrow + 1 + start_idx
-                        excel_end = startrow + 1 + end_idx
-                        value = col_vals.iloc[start_idx]
-
-                        if excel_start < excel_end:
-                            worksheet.merge_range(
-                                excel_start, col_index,
-                                excel_end, col_index,
-                                value, merge_format
-                            )
-                        else:
-                            worksheet.write(excel_start, col_index, value, merge_format)
-
-                        start_idx = i
-
-            # 4. ESCRIBIR COLUMNAS SIN FUSIÓN (Pacas y Origen)
-            for r in range(num_rows):
-                excel_row = startrow + 1 + r
+            plan = planificar_fusiones(df_sheet, MERGE_COLS, FUSION_ESTRICTA)
+            if memoria_constante:
+                fusiones = {col_index: plan[col_name] for col_name, col_index in merge_indices.items()}
+                _escribir_filas_en_orden(worksheet, df_sheet, range(startrow + 1, startrow + 1 + num_rows),
+                                         fusiones, merge_format, normal_format)
+            else:
+                for col_name, col_index in merge_indices.items():
+                    _escribir_fusiones(worksheet, startrow + 1, col_index, plan[col_name], merge_format)
+
+                # 4. ESCRIBIR COLUMNAS SIN FUSIÓN (Pacas y Origen)
                 for col_idx in non_merge_indices:
-                    value = df_sheet.iloc[r, col_idx]
-                    if pd.isna(value):
-                        worksheet.write_string(excel_row, col_idx, "", normal_format)
-                    else:
-                        worksheet.write(excel_row, col_idx, value, normal_format)
+                    _escribir_columna(worksheet, startrow + 1, col_idx, df_sheet.iloc[:, col_idx], normal_format)
 
             # 5. Autoajuste
             for i, col in enumerate(df_sheet.columns):
@@ -517,11 +652,12 @@ def to_excel_bultos(df, base_titulo: Optional[str] = "REPORTE"):
 
 
 
-def to_excel_agrupado(df, base_titulo: Optional[str] = "REPORTE"):
+def to_excel_agrupado(df, base_titulo: Optional[str] = "REPORTE", memoria_constante: Optional[bool] = None):
     """
     Convierte el DataFrame (asumiendo MultiIndex con 'conductor' en primer nivel) 
     a un archivo Excel, generando una hoja por cada conductor y fusionando las 
     celdas restantes para el agrupamiento visual.
+    Con memoria_constante se escribe en modo streaming (None: según FILAS_MEMORIA_CONSTANTE).
     """
     
     # --- 1. PREPARACIÓN DE DATOS ---
@@ -547,8 +683,9 @@ def to_excel_agrupado(df, base_titulo: Optional[str] = "REPORTE"):
     
     # --- LÓGICA DE EXCEL MULTI-HOJA ---
     output = BytesIO()
+    memoria_constante = _usar_memoria_constante(df_to_write, memoria_constante)
     
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+    with pd.ExcelWriter(output, engine='xlsxwriter', engine_kwargs=_opciones_excel(memoria_constante)) as writer:
         
         workbook = writer.book
         
@@ -597,52 +734,18 @@ def to_excel_agrupado(df, base_titulo: Optional[str] = "REPORTE"):
             ]
             
             # A) PROCESAR COLUMNAS DE AGRUPACIÓN (FUSIÓN)
-            for col_name, col_index in merged_col_indices.items():
-                col_data = df_sheet[col_name]
-                current_start_row_df_index = 0
-                num_rows_sheet = df_sheet.shape[0]
-
-                for i in range(1, num_rows_sheet + 1):
-                    is_end_of_df = (i == num_rows_sheet)
-                    
-                    val_current = col_data.iloc[i] if i < num_rows_sheet else None
-                    val_previous = col_data.iloc[i-1]
-                    
-                    is_new_group = not is_end_of_df and not pd.isna(val_current) and val_current != val_previous
-                    
-                    if is_end_of_df or is_new_group:
-                        
-                        end_row_df_index = i - 1
-                        
-                        if current_start_row_df_index <= end_row_df_index:
-                            
-                            excel_start_row = startrow_data + 1 + current_start_row_df_index
-                            excel_end_row = startrow_data + 1 + end_row_df_index
-                            value = col_data.iloc[current_start_row_df_index]
-
-                            if excel_start_row < excel_end_row:
-                                # 1. FUSIONAR CELDA
-                                worksheet.merge_range(
-                                    excel_start_row, col_index, excel_end_row, col_index, 
-                                    value, data_format 
-                                )
-                            else:
-                                # 2. Escribir celda normal (grupo de una sola fila)
-                                worksheet.write(excel_start_row, col_index, value, data_format)
-
-                        current_start_row_df_index = i
-
-            # B) PROCESAR COLUMNAS DE DATOS (ESCRITURA NORMAL)
-            for i in range(num_rows_sheet):
-                excel_row = startrow_data + 1 + i
+            plan = planificar_fusiones(df_sheet, MERGE_COLS, FUSION_NULO_CONTINUA)
+            if memoria_constante:
+                fusiones = {col_index: plan[col_name] for col_name, col_index in merged_col_indices.items()}
+                _escribir_filas_en_orden(worksheet, df_sheet, range(startrow_data + 1, startrow_data + 1 + len(df_sheet)),
+                                         fusiones, data_format, data_format)
+            else:
+                for col_name, col_index in merged_col_indices.items():
+                    _escribir_fusiones(worksheet, startrow_data + 1, col_index, plan[col_name], data_format)
+
+                # B) PROCESAR COLUMNAS DE DATOS (ESCRITURA NORMAL)
                 for col_index in data_col_indices:
-                    cell_value = df_sheet.iloc[i, col_index]
-                    
-                    # Manejo de NaN/None
-                    if pd.isna(cell_value):
-                        worksheet.write_string(excel_row, col_index, '', data_format)
-                    else:
-                        worksheet.write(excel_row, col_index, cell_value, data_format)
+                    _escribir_columna(worksheet, startrow_data + 1, col_index, df_sheet.iloc[:, col_index], data_format)
 
             # 4. Ajustar el ancho de las columnas (solo las columnas de esta hoja)
             for i, col in enumerate(df_sheet.columns):
@@ -654,7 +757,8 @@ def to_excel_agrupado(df, base_titulo: Optional[str] = "REPORTE"):
     processed_data = output.getvalue()
     return processed_data
 
-def to_excel_regueros_por_origen(df: pd.DataFrame, base_titulo: Optional[str] = "REPORTE"):
+def to_excel_regueros_por_origen(df: pd.DataFrame, base_titulo: Optional[str] = "REPORTE",
+                                 memoria_constante: Optional[bool] = None):
     
 
     # --- Copia local y normalización básica ---
@@ -698,8 +802,9 @@ def to_excel_regueros_por_origen(df: pd.DataFrame, base_titulo: Optional[str] =
     # Preparar salida Excel
     output = BytesIO()
     fecha = datetime.now().strftime("%Y-%m-%d")
+    memoria_constante = _usar_memoria_constante(df_local, memoria_constante)
 
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+    with pd.ExcelWriter(output, engine="xlsxwriter", engine_kwargs=_opciones_excel(memoria_constante)) as writer:
         workbook = writer.book
 
         # --- Formatos (similares a los anteriores) ---
@@ -758,65 +863,53 @@ def to_excel_regueros_por_origen(df: pd.DataFrame, base_titulo: Optional[str] =
             non_merge_indices = [cols_to_show.index(c) for c in cols_to_show if c not in merge_cols]
 
             # 3) Recorrer agrupaciones por ORIGEN
-            current_row = startrow + 1  # fila donde empiezan los datos (debajo del header)
-
-            # Agrupar por origen dentro de la zona (preservando el orden original aparece en el df)
-            for origen_val, df_origen in df_sheet_full.groupby(origen_col):
-
+            # Se ordena la zona por origen (orden estable, igual que groupby) y se
+            # planifican las fusiones de toda la hoja de una vez, cortando los grupos
+            # en cada cambio de origen.
+            df_ordenado = (
+                df_sheet_full.dropna(subset=[origen_col])
+                .sort_values(origen_col, kind="stable")
+                .reset_index(drop=True)
+            )
+            origenes = df_ordenado[origen_col].tolist()
+            inicio_bloque = np.ones(len(origenes), dtype=bool)
+            if len(origenes) > 1:
+                inicio_bloque[1:] = df_ordenado[origen_col].to_numpy()[1:] != df_ordenado[origen_col].to_numpy()[:-1]
+
+            # Fila de Excel de cada registro: datos debajo del header + un subtítulo por bloque
+            filas_excel = startrow + 1 + np.arange(len(origenes)) + np.cumsum(inicio_bloque)
+
+            def escribir_subtitulo(worksheet, pos):
+                fila_subtitulo = int(filas_excel[pos]) - 1
                 # Subtítulo por origen (fusionado)
                 if num_cols_shown > 0:
-                    worksheet.merge_range(current_row, 0, current_row, num_cols_shown - 1,
-                                          f"ORIGEN: {origen_val}", origen_title_format)
+                    worksheet.merge_range(fila_subtitulo, 0, fila_subtitulo, num_cols_shown - 1,
+                                          f"ORIGEN: {origenes[pos]}", origen_title_format)
                 else:
-                    worksheet.write(current_row, 0, f"ORIGEN: {origen_val}", origen_title_format)
-                current_row += 1
+                    worksheet.write(fila_subtitulo, 0, f"ORIGEN: {origenes[pos]}", origen_title_format)
 
-                # Bloque de datos de este origen
-                df_block = df_origen.reset_index(drop=True)
-                block_rows = len(df_block)
+            # --- FUSIONES por columna permitida: no cruzan de un origen a otro ---
+            plan = planificar_fusiones(df_ordenado, merge_cols, FUSION_NULOS_IGUALES, cortes=inicio_bloque)
 
-                # --- FUSIONES por columna permitida: se calculan dentro del bloque ---
-                for col_name, col_index in merge_indices.items():
-                    vals = df_block[col_name].astype(object)  # para evitar problemas con tipos
-                    start_idx = 0
-
-                    for i in range(1, block_rows + 1):
-                        is_last = (i == block_rows)
-                        curr = vals.iloc[i] if not is_last else None
-                        prev = vals.iloc[i - 1]
-
-                        # definir nuevo grupo si el valor cambia (manejar NaN)
-                        new_group = (not is_last) and ( (pd.isna(curr) and not pd.isna(prev)) or (pd.isna(prev) and not pd.isna(curr)) or (not pd.isna(curr) and curr != prev) )
-
-                        if is_last or new_group:
-                            end_idx = i - 1
-                            excel_start = current_row + start_idx
-                            excel_end = current_row + end_idx
-                            value = vals.iloc[start_idx]
-
-                            if excel_start < excel_end:
-                                worksheet.merge_range(excel_start, col_index, excel_end, col_index, value, merge_data_format)
-                            else:
-                                worksheet.write(excel_start, col_index, value, merge_data_format)
+            if memoria_constante:
+                # Subtítulos, fusiones y columnas sin fusión, en orden de fila
+                subtitulos = {pos: escribir_subtitulo for pos in np.flatnonzero(inicio_bloque).tolist()}
+                fusiones = {col_index: plan[col_name] for col_name, col_index in merge_indices.items()}
+                _escribir_filas_en_orden(worksheet, df_ordenado[cols_to_show], filas_excel.tolist(), fusiones,
+                                         merge_data_format, individual_data_format, subtitulos)
+            else:
+                for pos in np.flatnonzero(inicio_bloque):
+                    escribir_subtitulo(worksheet, pos)
 
-                            start_idx = i
+                for col_name, col_index in merge_indices.items():
+                    grupos = [(int(filas_excel[i]), int(filas_excel[f]), v) for i, f, v in plan[col_name]]
+                    _escribir_fusiones(worksheet, 0, col_index, grupos, merge_data_format)
 
                 # --- ESCRITURA de columnas que NO se fusionan (producto, Unidades, etc.) ---
-                for r in range(block_rows):
-                    excel_row = current_row + r
-                    for col_idx in non_merge_indices:
-                        col_name = cols_to_show[col_idx]
-                        val = df_block.iloc[r][col_name]
-                        if pd.isna(val):
-                            worksheet.write_string(excel_row, col_idx, "", individual_data_format)
-                        else:
-                            worksheet.write(excel_row, col_idx, val, individual_data_format)
-
-                # Avanzar el cursor por el tamaño del bloque
-                current_row += block_rows
-
-                # (Opcional) dejar una fila en blanco para separar visualmente bloques
-                # current_row += 1
+                for col_idx in non_merge_indices:
+                    col_name = cols_to_show[col_idx]
+                    _escribir_columna(worksheet, None, col_idx, df_ordenado[col_name],
+                                      individual_data_format, filas=filas_excel.tolist())
 
             # 4) Ajuste de ancho de columnas (por hoja)
             for i, col in enumerate(cols_to_show):